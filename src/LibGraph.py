@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: LibGraph.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: Sampling and caching of function graphs for graph mode
+###################################################################
+
+##
+# @file LibGraph.py
+# @author Vilem Gottwald, Pavel Marek
+#
+# @brief Adaptive sampling of graphs of LibProcExpr.VectorExpr and their cache of view tiles
+# The x axis is divided into tiles of tile_pixels pixels. Every tile is sampled on its own: a few uniform
+# points first, then intervals whose midpoint is farther than half a pixel from the straight line, or where
+# the function starts or stops being defined, are halved until they are smaller than half a pixel.
+# Sampled tiles are cached for the current scale, so panning only samples the tiles that appear
+# and a redraw that runs out of its time budget shows what is ready and continues in the next frame.
+# Requires NumPy.
+#
+
+import time
+import numpy as np
+import LibProcExpr
+
+##
+# @brief Samples function adaptively, densely where it bends or isn't defined
+#
+# @param compiled LibProcExpr.VectorExpr to sample
+# @param x0 Start of the interval
+# @param x1 End of the interval
+# @param count Number of uniform intervals sampled first
+# @param tolerance Largest allowed distance (in y units) of the curve from the straight line between samples
+# @param max_depth Largest number of halvings of the uniform intervals
+#
+# @return Arrays of x and y values sorted by x, y is NaN where the function isn't defined
+def adaptive_sample(compiled, x0, x1, count=8, tolerance=1e-3, max_depth=5):
+    xs = np.linspace(x0, x1, count + 1)
+    ys = compiled.evaluate(xs)
+    found_x = [xs]
+    found_y = [ys]
+
+    a, b, ya, yb = xs[:-1], xs[1:], ys[:-1], ys[1:]
+    for depth in range(max_depth):
+        if a.size == 0:
+            break
+        m = (a + b) / 2
+        ym = compiled.evaluate(m)
+        with np.errstate(invalid="ignore"):
+            bend = np.abs(ym - (ya + yb) / 2) > tolerance
+        nan_a, nan_b, nan_m = np.isnan(ya), np.isnan(yb), np.isnan(ym)
+        edge = (nan_a != nan_b) | (nan_m != nan_a) | (nan_m != nan_b)
+        keep = bend | edge
+        found_x.append(m[keep])
+        found_y.append(ym[keep])
+        m, ym = m[keep], ym[keep]
+        a, b = np.concatenate((a[keep], m)), np.concatenate((m, b[keep]))
+        ya, yb = np.concatenate((ya[keep], ym)), np.concatenate((ym, yb[keep]))
+
+    xs = np.concatenate(found_x)
+    ys = np.concatenate(found_y)
+    order = np.argsort(xs, kind="stable")
+    return xs[order], ys[order]
+
+##
+# @brief View of a graph, its cache of sampled tiles and conversion to polylines in pixels
+#
+class GraphRenderer:
+    ##
+    # @brief Constructor
+    #
+    # @param width Width of the drawing area in pixels
+    # @param height Height of the drawing area in pixels
+    # @param tile_pixels Width of a tile in pixels
+    # @param cache_size Largest number of cached tiles
+    def __init__(self, width, height, tile_pixels=64, cache_size=512):
+        self.width = width
+        self.height = height
+        self.tile_pixels = tile_pixels
+        self.cache = LibProcExpr.LRUCache(cache_size)
+        self.set_view(-10, 10, -6, 6)
+
+    ##
+    # @brief Sets the displayed region
+    #
+    # @param x0 Left edge
+    # @param x1 Right edge
+    # @param y0 Bottom edge
+    # @param y1 Top edge
+    def set_view(self, x0, x1, y0, y1):
+        self.x0 = x0
+        self.y0 = y0
+        self.x_scale = (x1 - x0) / self.width
+        self.y_scale = (y1 - y0) / self.height
+
+    ##
+    # @brief Moves the view, scale stays the same so the cached tiles are used again
+    #
+    # @param dx Shift in pixels to the right (the graph moves with the mouse)
+    # @param dy Shift in pixels down
+    def pan(self, dx, dy):
+        self.x0 -= dx * self.x_scale
+        self.y0 += dy * self.y_scale
+
+    ##
+    # @brief Zooms the view, the point under given pixel stays in place
+    #
+    # @param factor Zoom factor, larger than 1 zooms in
+    # @param px X coordinate of the fixed pixel
+    # @param py Y coordinate of the fixed pixel
+    def zoom(self, factor, px, py):
+        x, y = self.to_units(px, py)
+        self.x_scale /= factor
+        self.y_scale /= factor
+        self.x0 = x - px * self.x_scale
+        self.y0 = y - (self.height - py) * self.y_scale
+
+    ##
+    # @brief Converts pixel coordinates to coordinates of the graph
+    #
+    # @return (x, y)
+    def to_units(self, px, py):
+        return self.x0 + px * self.x_scale, self.y0 + (self.height - py) * self.y_scale
+
+    ##
+    # @brief Converts coordinates of the graph to pixel coordinates
+    #
+    # @return (px, py), arrays if arrays are given
+    def to_pixels(self, x, y):
+        return (x - self.x0) / self.x_scale, self.height - (y - self.y0) / self.y_scale
+
+    ##
+    # @brief Returns samples of one tile, sampling it if it isn't cached
+    #
+    # @param compiled LibProcExpr.VectorExpr to sample
+    # @param index Index of the tile, tile 0 starts at x = 0
+    # @param sample False returns None instead of sampling a missing tile
+    #
+    # @return (xs, ys) or None
+    def tile(self, compiled, index, sample=True):
+        key = (compiled.expression, self.x_scale, self.y_scale, index)
+        samples = self.cache.get(key)
+        if samples is None and sample:
+            tile_width = self.tile_pixels * self.x_scale
+            samples = adaptive_sample(compiled, index * tile_width, (index + 1) * tile_width,
+                                      count=self.tile_pixels // 8, tolerance=self.y_scale / 2,
+                                      max_depth=5)
+            self.cache.put(key, samples)
+        return samples
+
+    ##
+    # @brief Computes polylines of the graph in the current view
+    # Missing tiles are sampled until the time budget runs out, the rest is left for the next call.
+    # Lines are broken where the function isn't defined or jumps by more than the height of the view.
+    #
+    # @param compiled LibProcExpr.VectorExpr to draw
+    # @param budget Time in seconds available for sampling
+    #
+    # @return (list of polylines as flat lists [x0, y0, x1, y1, ...] in pixels, True if all tiles were ready)
+    def render(self, compiled, budget=0.016):
+        start = time.perf_counter()
+        tile_width = self.tile_pixels * self.x_scale
+        first = int(np.floor(self.x0 / tile_width))
+        last = int(np.floor((self.x0 + self.width * self.x_scale) / tile_width))
+
+        complete = True
+        parts = list()
+        for index in range(first, last + 1):
+            samples = self.tile(compiled, index, time.perf_counter() - start < budget)
+            if samples is None:
+                complete = False
+                # a gap in the data breaks the line
+                parts.append((np.array([np.nan]), np.array([np.nan])))
+            else:
+                parts.append(samples)
+        xs = np.concatenate([part[0] for part in parts])
+        ys = np.concatenate([part[1] for part in parts])
+        return self.polylines(xs, ys), complete
+
+    ##
+    # @brief Converts samples to polylines in pixels
+    #
+    # @param xs X values sorted in ascending order
+    # @param ys Y values, NaN where the function isn't defined
+    #
+    # @return List of polylines as flat lists [x0, y0, x1, y1, ...]
+    def polylines(self, xs, ys):
+        with np.errstate(invalid="ignore", over="ignore"):
+            px, py = self.to_pixels(xs, ys)
+            defined = np.isfinite(py)
+            # points far outside of the view are clamped, so Tk gets reasonable coordinates
+            py = np.clip(np.where(defined, py, 0), -self.height, 2 * self.height)
+            jumps = np.abs(np.diff(py)) > self.height
+        breaks = ~defined[:-1] | ~defined[1:] | jumps
+
+        lines = list()
+        begin = 0
+        for end in np.flatnonzero(breaks) + 1:
+            self.add_line(lines, px, py, defined, begin, end)
+            begin = end
+        self.add_line(lines, px, py, defined, begin, px.size)
+        return lines
+
+    ##
+    # @brief Appends defined points from begin to end as a polyline, if there are at least two
+    def add_line(self, lines, px, py, defined, begin, end):
+        mask = defined[begin:end]
+        if np.count_nonzero(mask) >= 2:
+            lines.append(np.column_stack((px[begin:end][mask], py[begin:end][mask])).ravel().tolist())
+
+# End of file LibGraph.py
@@ -0,0 +1,78 @@
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: LibGraph_Tests.py
+# Authors: Vilem Gottwald
+# Description: Test for LibGraph.py
+###################################################################
+# Run the tests in directory src:
+# $ python3 LibGraph_Tests.py
+#
+
+import unittest
+import LibProcExpr
+
+try:
+    import numpy as np
+    import LibGraph
+except ImportError:
+    np = None
+
+
+# Tests of function adaptive_sample
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestAdaptiveSample(unittest.TestCase):
+
+    def test_line_needs_no_refinement(self):
+        xs, ys = LibGraph.adaptive_sample(LibProcExpr.VectorExpr("2*x+1"), 0, 8, count=8)
+        self.assertEqual(len(xs), 9)
+        np.testing.assert_allclose(ys, 2 * xs + 1)
+
+    def test_curve_is_refined_where_it_bends(self):
+        xs, ys = LibGraph.adaptive_sample(LibProcExpr.VectorExpr("1/x"), 0.1, 10, count=8, tolerance=0.01)
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertGreater(np.count_nonzero(xs < 1.3), np.count_nonzero(xs > 8.7))
+
+    def test_edge_of_domain_is_refined(self):
+        xs, ys = LibGraph.adaptive_sample(LibProcExpr.VectorExpr("√x"), -1, 1, count=2, tolerance=10, max_depth=5)
+        defined = xs[~np.isnan(ys)]
+        self.assertLess(defined.min(), 1 / 32)
+
+
+# Tests of class GraphRenderer
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestGraphRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.renderer = LibGraph.GraphRenderer(320, 200, tile_pixels=64)
+        self.renderer.set_view(-8, 8, -5, 5)
+
+    def test_pan_samples_only_new_tiles(self):
+        compiled = LibProcExpr.VectorExpr("x^2/10")
+        lines, complete = self.renderer.render(compiled, budget=10)
+        self.assertTrue(complete)
+        sampled = self.renderer.cache.stats()["misses"]
+        self.renderer.pan(80, 10)
+        self.renderer.render(compiled, budget=10)
+        self.assertEqual(self.renderer.cache.stats()["misses"], sampled + 1)
+
+    def test_lines_break_at_discontinuity(self):
+        lines, complete = self.renderer.render(LibProcExpr.VectorExpr("1/x"), budget=10)
+        self.assertEqual(len(lines), 2)
+        self.assertLess(lines[0][-2], 160)
+        self.assertGreater(lines[1][0], 160)
+
+    def test_budget_leaves_tiles_for_next_frame(self):
+        compiled = LibProcExpr.VectorExpr("x^3")
+        lines, complete = self.renderer.render(compiled, budget=0)
+        self.assertFalse(complete)
+        lines, complete = self.renderer.render(compiled, budget=10)
+        self.assertTrue(complete)
+
+    def test_pixel_conversion(self):
+        self.assertEqual(self.renderer.to_pixels(0, 0), (160, 100))
+        self.renderer.zoom(2, 80, 50)
+        self.assertEqual(self.renderer.to_units(80, 50), (-4, 2.5))
+
+# to simplify testing
+if __name__ == '__main__':
+    unittest.main()
@@ -16,9 +16,114 @@
 # This math library contains basic mathematical function.
 #
 
-## number of digits to which the library rounds
+from contextvars import ContextVar
+from decimal import Decimal, localcontext
+from math import isqrt
+
+## number of digits to which the library rounds, used by contexts that don't set their own
 digits = 10
 
+##
+# @brief Settings used by the functions of the library
+# Every thread (and asyncio task) has its own current context, so evaluations with different
+# settings can run in parallel. Context is made current by a with block:
+#
+#     with LibMath.Context(digits=4, backend=Decimal):
+#         ...
+#
+class Context:
+    ##
+    # @brief Constructor of the context
+    #
+    # @param digits Number of digits to which the results are rounded, None for module variable digits
+    # @param backend Type of non-integer numbers, float or decimal.Decimal
+    #
+    # @exception ValueError if backend isn't supported
+    def __init__(self, digits=None, backend=float):
+        if backend is not float and backend is not Decimal:
+            raise ValueError("Context error - backend has to be float or Decimal")
+        self.digits = digits
+        self.backend = backend
+
+    def __repr__(self):
+        return "Context(digits=%r, backend=%s)" % (self.digits, self.backend.__name__)
+
+    def __enter__(self):
+        context_stack.set((self, context_stack.get()))
+        return self
+
+    def __exit__(self, *exc_info):
+        context_stack.set(context_stack.get()[1])
+
+## context used when no other context is current
+default_context = Context()
+
+## current context and the contexts it replaced, as nested pairs (context, previous)
+context_stack = ContextVar("context_stack", default=(default_context, None))
+
+##
+# @brief Function to get the current context
+#
+# @return Current Context object
+def getcontext():
+    return context_stack.get()[0]
+
+##
+# @brief Function to replace the current context (of the calling thread or task)
+#
+# @param context New current Context object
+def setcontext(context):
+    context_stack.set((context, context_stack.get()[1]))
+
+##
+# @brief Function to get the number of digits to which results are currently rounded
+#
+# @return Number of digits from the current context
+def get_digits():
+    context_digits = context_stack.get()[0].digits
+    return digits if context_digits is None else context_digits
+
+##
+# @brief Function to round result of an operation to the current number of digits
+#
+# @param x Result of the operation
+#
+# @return Rounded result
+def round_result(x):
+    if x.__class__ is Decimal:
+        return decimal_result(lambda: x)
+    return round(x, get_digits())
+
+## number of significant digits Decimal operations keep in addition to the rounded decimal places,
+## more are used when the integer part of the result is longer
+decimal_guard_digits = 28
+
+##
+# @brief Function to compute operation with Decimal numbers and round its result to the current number of digits
+# The operation is computed with precision covering the integer digits of the result and get_digits()
+# decimal places, so the result isn't limited by the precision of the decimal module (28 digits by default).
+# When the result turns out to have more integer digits than the precision covered, it's computed again.
+#
+# @param compute Function without parameters computing the operation
+#
+# @return Rounded result, NaN and infinity are returned as they are
+def decimal_result(compute):
+    places = get_digits()
+    prec = max(places, 0) + decimal_guard_digits
+    while True:
+        with localcontext() as context:
+            context.prec = prec
+            result = compute()
+            if not result.is_finite():
+                return result
+            needed = places + result.adjusted() + 2
+            if needed <= prec:
+                return round(result, places)
+        prec = needed
+
+## integer radicands are rooted exactly for degrees up to this value
+int_root_max_degree = 1000
+
 ##
 # @brief Function to add two numbers.
 #
@@ -27,7 +132,10 @@ digits = 10
 #
 # @return Sum of a and b
 def add(a, b):
-    return round(a + b, digits)
+    result = a + b
+    if result.__class__ is Decimal:
+        return decimal_result(lambda: a + b)
+    return round_result(result)
 
 ##
 # @brief Function to subtract one number from another.
@@ -37,7 +145,10 @@ def add(a, b):
 #
 # @return Difference of a and b
 def sub(a, b):
-    return round(a - b, digits)
+    result = a - b
+    if result.__class__ is Decimal:
+        return decimal_result(lambda: a - b)
+    return round_result(result)
 
 ##
 # @brief Function to multiply two numbers.
@@ -47,7 +158,10 @@ def sub(a, b):
 #
 # @return Product of a and b
 def mul(a, b):
-    return round(a * b, digits)
+    result = a * b
+    if result.__class__ is Decimal:
+        return decimal_result(lambda: a * b)
+    return round_result(result)
 
 ##
 # @brief Function to divide two numbers.
@@ -61,7 +175,9 @@ def mul(a, b):
 def div(a, b):
     if b == 0:
         raise ZeroDivisionError("Division error - dividing by zero")
-    return round(a / b, digits)
+    if getcontext().backend is Decimal or a.__class__ is Decimal or b.__class__ is Decimal:
+        return decimal_result(lambda: Decimal(a) / Decimal(b))
+    return round_result(a / b)
 
 ##
 # @brief Function to compute the remainder of a division.
@@ -79,27 +195,117 @@ def mod(a, b):
         raise ValueError("Modulo error - both operands have to be integer")
     if b == 0:
         raise ZeroDivisionError("Division error - dividing by zero")
-    return round(a % b, digits)
+    return round_result(a % b)
+
+## factorials of numbers smaller than fact_table_size are looked up in fact_table
+fact_table_size = 64
+fact_table = [1]
+for i in range(1, fact_table_size):
+    fact_table.append(fact_table[-1] * i)
+del i
+
+## factorials of at least this size are computed by worker processes when fact is given workers
+parallel_fact_min = 100000
+
+##
+# @brief Function to multiply odd numbers from the interval [start, stop)
+# Numbers are multiplied by binary splitting, so that factors of similar size meet.
+#
+# @param start First odd number of the interval
+# @param stop End of the interval (odd, excluded)
+#
+# @return Product of the odd numbers
+def odd_product(start, stop):
+    count = (stop - start) // 2
+    if count <= 8:
+        result = 1
+        for num in range(start, stop, 2):
+            result *= num
+        return result
+    middle = start + count // 2 * 2
+    return odd_product(start, middle) * odd_product(middle, stop)
+
+##
+# @brief Function to compute the odd part of factorial (factorial without its factors of two)
+# n! is split into products of odd numbers from intervals (n >> (i + 1), n >> i],
+# the i-th product appears in the odd part i + 1 times.
+#
+# @param a Number, odd part of factorial will be computed from
+#
+# @return Odd part of factorial of given number
+def fact_odd_part(a):
+    inner = outer = 1
+    for i in range(a.bit_length() - 2, -1, -1):
+        inner *= odd_product((a >> (i + 1)) + 1 | 1, (a >> i) + 1 | 1)
+        outer *= inner
+    return outer
+
+##
+# @brief Function to multiply numbers from the interval [start, stop) by binary splitting
+#
+# @param start First number of the interval
+# @param stop End of the interval (excluded)
+#
+# @return Product of the numbers
+def range_product(start, stop):
+    if stop - start <= 8:
+        result = 1
+        for num in range(start, stop):
+            result *= num
+        return result
+    middle = (start + stop) // 2
+    return range_product(start, middle) * range_product(middle, stop)
+
+##
+# @brief Function to multiply list of numbers by binary splitting
+#
+# @param nums List of numbers
+#
+# @return Product of the numbers
+def tree_product(nums):
+    while len(nums) > 1:
+        paired = [nums[i] * nums[i + 1] for i in range(0, len(nums) - 1, 2)]
+        if len(nums) % 2:
+            paired.append(nums[-1])
+        nums = paired
+    return nums[0] if nums else 1
+
+##
+# @brief Function to compute factorial using several processes
+# Interval 1..a is split into parts multiplied by worker processes, the partial products are then
+# multiplied together.
+#
+# @param a Number, factorial will be computed from
+# @param workers Number of worker processes
+#
+# @return Factorial of given number
+def parallel_fact(a, workers):
+    from concurrent.futures import ProcessPoolExecutor
+
+    bounds = [1 + a * i // workers for i in range(workers + 1)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(range_product, bounds[:-1], bounds[1:]))
+    return tree_product(parts)
 
 ##
 # @brief Function to compute factorial.
+# Small factorials are taken from fact_table, the others are computed from the odd part,
+# which is shifted by the number of factors of two.
 #
 # @param a Number, factorial will be computed from
+# @param workers Number of processes used for factorials of at least parallel_fact_min, default is 1
 #
 # @exception ValueError if Number isn't positive integer
 #
 # @return Factorial of given number
-def fact(a):
+def fact(a, workers=1):
     if not isinstance(a, int) or a < 0:
         raise ValueError("Factorial error - number isn't integer or is smaller than 0")
-    if a == 0:
-        return 1
-
-    result = a
-    while a != 1:
-        a -= 1
-        result *= a
-    return result
+    if a < fact_table_size:
+        return fact_table[a]
+    if workers > 1 and a >= parallel_fact_min:
+        return parallel_fact(a, workers)
+    return fact_odd_part(a) << (a - bin(a).count("1"))
 
 ##
 # @brief Function to compute power
@@ -116,10 +322,89 @@ def power(a, exp):
         raise ValueError("Power error - exponent is not a natural number")
     if a == 0 and exp == 0:
         raise ValueError("Power error - zero raised to zero ins't defined")
-    return round(a**exp, digits)
+    if a.__class__ is Decimal:
+        return decimal_result(lambda: a**exp)
+    return round_result(a**exp)
+
+##
+# @brief Function to compute remainder of power divided by a number (a^exp % m)
+# Result is the same as of mod(power(a, exp), m), but the power is never computed in full.
+#
+# @param a Base
+# @param exp Exponent
+# @param m Divisor
+#
+# @exception ValueError if Exponent isn't a natural number
+# @exception ValueError if Exponent and Base are zeros
+# @exception ValueError if Base or Divisor aren't integers
+# @exception ZeroDivisionError if Divisor is zero
+#
+# @return Remainder of a^exp divided by m
+def powmod(a, exp, m):
+    if not isinstance(exp, int) or exp < 0:
+        raise ValueError("Power error - exponent is not a natural number")
+    if a == 0 and exp == 0:
+        raise ValueError("Power error - zero raised to zero ins't defined")
+    if not(isinstance(a, int) and isinstance(m, int)):
+        raise ValueError("Modulo error - both operands have to be integer")
+    if m == 0:
+        raise ZeroDivisionError("Division error - dividing by zero")
+    return pow(a, exp, m)
+
+##
+# @brief Function to compute integer part of root using Newton's method
+#
+# @param a Radicand, non-negative integer
+# @param deg Degree, positive integer
+#
+# @return Largest integer r such that r^deg <= a
+def int_root(a, deg):
+    if a < 2 or deg == 1:
+        return a
+    if deg == 2:
+        return isqrt(a)
+
+    # starting above the root, the iteration decreases until it reaches it
+    x = 1 << -(-a.bit_length() // deg)
+    while True:
+        y = ((deg - 1) * x + a // x**(deg - 1)) // deg
+        if y >= x:
+            return x
+        x = y
+
+##
+# @brief Function to compute root of an integer exactly
+# Perfect powers give an integer result, other radicands are rounded to get_digits() decimal places
+# from the exact value (not from a float approximation).
+#
+# @param a Radicand, non-negative integer
+# @param deg Degree, positive integer
+#
+# @return Result of the root
+def exact_root(a, deg):
+    result = int_root(a, deg)
+    if result**deg == a:
+        return result
+
+    places = get_digits()
+    scale = 10**places
+    scaled_a = a * scale**deg
+    result = int_root(scaled_a, deg)
+    # rounding to the nearest, (2 * result + 1) / 2 is the midpoint between result and result + 1
+    if (2 * result + 1)**deg <= scaled_a << deg:
+        result += 1
+    if getcontext().backend is Decimal:
+        return decimal_result(lambda: Decimal(result).scaleb(-places))
+    try:
+        return result / scale
+    except OverflowError:
+        # too large for float, the decimal places wouldn't be kept anyway
+        return (2 * result + scale) // (2 * scale)
 
 ##
 # @brief Function to compute root
+# Integer radicands with integer degree (1 to int_root_max_degree) are computed exactly by exact_root,
+# other numbers in floating point.
 #
 # @param a Radicand
 # @param deg Degree
@@ -139,7 +424,12 @@ def root(a, deg):
         a = -a
         negate = True
 
-    result = round(a**(1/deg), digits)
+    if isinstance(a, int) and isinstance(deg, int) and 0 < deg <= int_root_max_degree and get_digits() >= 0:
+        result = exact_root(a, deg)
+    elif getcontext().backend is Decimal:
+        result = decimal_result(lambda: Decimal(a) ** (1 / Decimal(deg)))
+    else:
+        result = round_result(a**(1/deg))
     return -result if negate else result
 
 ##
@@ -154,4 +444,15 @@ def abs(x):
     if x < 0:
         return -x
 
+##
+# @brief Gives access to NumPy variants of the functions as LibMath.vec (module LibMathVec).
+# NumPy is imported only when vec is used for the first time.
+#
+# @exception AttributeError if the module has no such attribute
+def __getattr__(name):
+    if name == "vec":
+        import LibMathVec
+        return LibMathVec
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
 # End of file LibMath.py
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: LibMathVec.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: NumPy variants of the operations from LibMath
+###################################################################
+
+##
+# @file LibMathVec.py
+# @author Vilem Gottwald, Pavel Marek
+#
+# @brief NumPy variants of the operations from LibMath, available as LibMath.vec
+# Functions accept NumPy arrays (or anything np.asarray accepts, scalars included) and apply
+# the operation element by element. Results are rounded to the digits of the current LibMath context
+# like the scalar functions.
+#
+# Integers are converted to floats before adding, subtracting, multiplying and raising to a power,
+# as NumPy integers would silently overflow, so large results are approximate (or infinite) instead of wrong.
+#
+# Domain rules are the same as in LibMath. What happens to elements breaking them is chosen
+# by the errors parameter (NaN operands are treated as breaking them in "nan" and "mask" modes):
+#   - "raise" raises the same exception as the scalar function, if any element breaks the rule
+#   - "nan"   returns float array with NaN in place of such elements
+#   - "mask"  returns numpy.ma.MaskedArray with such elements masked
+#
+
+import numpy as np
+import LibMath
+
+## allowed values of the errors parameter
+error_modes = ("raise", "nan", "mask")
+
+##
+# @brief Function that reports elements breaking a domain rule
+#
+# @param bad Boolean array, True for elements breaking the rule
+# @param error Exception raised in "raise" mode
+# @param errors Error handling mode
+#
+# @exception ValueError if errors isn't one of error_modes
+def check_domain(bad, error, errors):
+    if errors not in error_modes:
+        raise ValueError("Error - unknown error mode " + repr(errors))
+    if errors == "raise" and np.any(bad):
+        raise error
+
+##
+# @brief Function that applies error handling mode to the result
+#
+# @param result Result of the operation
+# @param bad Boolean array, True for elements breaking domain rules
+# @param errors Error handling mode
+#
+# @return Result with bad elements replaced (by NaN) or masked
+def finish(result, bad, errors):
+    if errors == "nan" and np.any(bad):
+        result = np.where(bad, np.nan, result)
+    elif errors == "mask":
+        result = np.ma.masked_array(result, mask=np.broadcast_to(bad, np.shape(result)))
+    return result
+
+##
+# @brief Adds two arrays element by element.
+#
+# @param a First addend
+# @param b Second addend
+#
+# @return Sum of a and b
+def add(a, b):
+    return np.round(np.add(np.asarray(a, dtype=float), np.asarray(b, dtype=float)), LibMath.get_digits())
+
+##
+# @brief Subtracts two arrays element by element.
+#
+# @param a Minuend
+# @param b Subtrahend
+#
+# @return Difference of a and b
+def sub(a, b):
+    return np.round(np.subtract(np.asarray(a, dtype=float), np.asarray(b, dtype=float)), LibMath.get_digits())
+
+##
+# @brief Multiplies two arrays element by element.
+#
+# @param a First factor
+# @param b Second factor
+#
+# @return Product of a and b
+def mul(a, b):
+    with np.errstate(over="ignore"):
+        return np.round(np.multiply(np.asarray(a, dtype=float), np.asarray(b, dtype=float)), LibMath.get_digits())
+
+##
+# @brief Divides two arrays element by element.
+#
+# @param a Dividend
+# @param b Divisor
+# @param errors Error handling mode, see the file description
+#
+# @exception ZeroDivisionError in "raise" mode if any divisor is zero
+#
+# @return Quotient of a and b
+def div(a, b, errors="raise"):
+    a = np.asarray(a)
+    b = np.asarray(b)
+    bad = b == 0
+    check_domain(bad, ZeroDivisionError("Division error - dividing by zero"), errors)
+    result = np.round(np.true_divide(a, np.where(bad, 1, b)), LibMath.get_digits())
+    return finish(result, bad, errors)
+
+##
+# @brief Computes remainder of division element by element.
+# Both operands have to be integers (integral floats are accepted as well).
+#
+# @param a Dividend
+# @param b Divisor
+# @param errors Error handling mode, see the file description
+#
+# @exception ValueError in "raise" mode if any operand isn't integer
+# @exception ZeroDivisionError in "raise" mode if any divisor is zero
+#
+# @return Remainder of a and b division
+def mod(a, b, errors="raise"):
+    a = np.asarray(a)
+    b = np.asarray(b)
+    bad = np.zeros(np.broadcast(a, b).shape, dtype=bool)
+    if not np.issubdtype(a.dtype, np.integer):
+        bad = bad | (a != np.floor(a))
+    if not np.issubdtype(b.dtype, np.integer):
+        bad = bad | (b != np.floor(b))
+    check_domain(bad, ValueError("Modulo error - both operands have to be integer"), errors)
+    zeros = b == 0
+    check_domain(zeros, ZeroDivisionError("Division error - dividing by zero"), errors)
+    bad = bad | zeros
+
+    result = np.mod(np.where(bad, 0, a), np.where(bad, 1, b))
+    return finish(result, bad, errors)
+
+## factorials of 0 to 170 as floats, factorials of larger numbers don't fit into float
+fact_floats = np.concatenate(([1.0], np.cumprod(np.arange(1, 171, dtype=float))))
+
+##
+# @brief Computes factorial element by element.
+# Results are floats, factorials larger than the largest float are infinite.
+#
+# @param a Numbers, factorial will be computed from
+# @param errors Error handling mode, see the file description
+#
+# @exception ValueError in "raise" mode if any number isn't integer or is smaller than 0
+#
+# @return Factorials of given numbers
+def fact(a, errors="raise"):
+    a = np.asarray(a)
+    bad = (a < 0) | (a != np.floor(a))
+    check_domain(bad, ValueError("Factorial error - number isn't integer or is smaller than 0"), errors)
+
+    index = np.where(bad, 0, np.minimum(a, fact_floats.size)).astype(np.int64)
+    result = np.where(index < fact_floats.size, fact_floats[np.minimum(index, fact_floats.size - 1)], np.inf)
+    return finish(result, bad, errors)
+
+##
+# @brief Computes power element by element.
+# Exponents have to be natural numbers (integral floats are accepted as well).
+#
+# @param a Base
+# @param exp Exponent
+# @param errors Error handling mode, see the file description
+#
+# @exception ValueError in "raise" mode if any exponent isn't a natural number
+# @exception ValueError in "raise" mode if any exponent and base are zeros
+#
+# @return Result of the exponentiation
+def power(a, exp, errors="raise"):
+    a = np.asarray(a, dtype=float)
+    exp = np.asarray(exp)
+    bad = (exp < 0) | (exp != np.floor(exp))
+    check_domain(bad, ValueError("Power error - exponent is not a natural number"), errors)
+    zeros = (a == 0) & (exp == 0)
+    check_domain(zeros, ValueError("Power error - zero raised to zero ins't defined"), errors)
+    # NaN left by an earlier domain error stays NaN (NumPy computes nan**0 as 1)
+    bad = bad | zeros | np.isnan(a) | np.isnan(exp)
+
+    with np.errstate(over="ignore"):
+        result = np.round(np.power(a, np.where(bad, 1, exp)), LibMath.get_digits())
+    return finish(result, bad, errors)
+
+##
+# @brief Computes root element by element.
+#
+# @param a Radicand
+# @param deg Degree
+# @param errors Error handling mode, see the file description
+#
+# @exception ValueError in "raise" mode if any radicand is negative and its degree even
+# @exception ValueError in "raise" mode if any degree is zero
+# @exception ZeroDivisionError in "raise" mode if zero radicand has negative degree
+#
+# @return Result of the root
+def root(a, deg, errors="raise"):
+    a = np.asarray(a, dtype=float)
+    deg = np.asarray(deg, dtype=float)
+    with np.errstate(invalid="ignore"):
+        parity = np.mod(deg, 2)
+    bad = (parity == 0) & (a < 0)
+    check_domain(bad, ValueError("Root error - even degree of a negative radicant"), errors)
+    zero_deg = deg == 0
+    check_domain(zero_deg, ValueError("Root error - degree can't be zero"), errors)
+    zero_neg = (a == 0) & (deg < 0)
+    check_domain(zero_neg, ZeroDivisionError("Root error - zero radicand of negative degree"), errors)
+    # NaN left by an earlier domain error stays NaN (NumPy computes 1**nan as 1)
+    bad = bad | zero_deg | zero_neg | np.isnan(a) | np.isnan(deg)
+
+    negate = (a < 0) & (parity == 1)
+    a = np.where(negate, -a, a)
+    with np.errstate(invalid="ignore"):
+        result = np.round(np.power(np.where(bad, 1, a), 1 / np.where(bad, 1, deg)), LibMath.get_digits())
+    return finish(np.where(negate, -result, result), bad, errors)
+
+##
+# @brief Computes absolute value element by element.
+#
+# @param x Array, absolute value will be computed from
+#
+# @return Absolute values of given array
+def abs(x):
+    return np.absolute(x)
+
+# End of file LibMathVec.py
@@ -9,9 +9,17 @@
 # $ python3 LibMath_Tests.py
 #
 
+import math
+import threading
 import unittest
+from decimal import Decimal, InvalidOperation
 import LibMath
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 # Tests of function add
 class TestAdd(unittest.TestCase):
@@ -163,6 +171,14 @@ class TestFact(unittest.TestCase):
         self.assertEqual(LibMath.fact(3), 6)
         self.assertEqual(LibMath.fact(12), 479001600)
 
+    def test_fact_large(self):
+        for n in [63, 64, 65, 100, 1000, 4321, 20000]:
+            self.assertEqual(LibMath.fact(n), math.factorial(n))
+
+    def test_fact_parallel(self):
+        n = LibMath.parallel_fact_min + 17
+        self.assertEqual(LibMath.fact(n, workers=2), math.factorial(n))
+
 
 # Tests of function power
 class TestPower(unittest.TestCase):
@@ -210,6 +226,29 @@ class TestPower(unittest.TestCase):
         self.assertAlmostEqual(LibMath.power(-21.112, 5), -4194178.272112056696)
 
 
+# Tests of function powmod
+class TestPowmod(unittest.TestCase):
+
+    def test_powmod_int(self):
+        self.assertEqual(LibMath.powmod(7, 3, 5), 3)
+        self.assertEqual(LibMath.powmod(-7, 3, 5), 2)
+        self.assertEqual(LibMath.powmod(7, 3, -5), -2)
+        self.assertEqual(LibMath.powmod(7, 0, 5), 1)
+        self.assertEqual(LibMath.powmod(12345, 10**6, 1000), LibMath.mod(LibMath.power(12345, 10**6), 1000))
+
+    def test_powmod_errors(self):
+        with self.assertRaises(ValueError):
+            LibMath.powmod(0, 0, 5)
+        with self.assertRaises(ValueError):
+            LibMath.powmod(2, -1, 5)
+        with self.assertRaises(ValueError):
+            LibMath.powmod(2.5, 2, 5)
+        with self.assertRaises(ValueError):
+            LibMath.powmod(2, 2, 5.5)
+        with self.assertRaises(ZeroDivisionError):
+            LibMath.powmod(2, 2, 0)
+
+
 # Tests of function root
 class TestRoot(unittest.TestCase):
 
@@ -237,6 +276,16 @@ class TestRoot(unittest.TestCase):
         self.assertEqual(LibMath.root(15, 1), 15)
         self.assertEqual(LibMath.root(0, 2), 0)
 
+    def test_root_int_exact(self):
+        big = 12345678901234567890123456789 ** 7
+        self.assertEqual(LibMath.root(big * big, 2), big)
+        self.assertEqual(LibMath.root(big ** 3, 3), big)
+        self.assertEqual(LibMath.root(-big ** 3, 3), -big)
+        self.assertIsInstance(LibMath.root(27, 3), int)
+        self.assertEqual(LibMath.root(2, 2), 1.4142135624)
+        self.assertEqual(LibMath.root(10, 3), 2.15443469)
+        self.assertEqual(LibMath.root(10 ** 800 + 1, 2), 10 ** 400)
+
     def test_root_float_positive(self):
         self.assertAlmostEqual(LibMath.root(185.55, 2.33), 9.409973368, 6) 
         self.assertEqual(LibMath.root(0.2, 0.2), 0.00032)
@@ -273,6 +322,125 @@ class TestAbs(unittest.TestCase):
         self.assertEqual(LibMath.abs(0), 0)
 
 
+# Tests of precision contexts
+class TestContext(unittest.TestCase):
+
+    def test_context_digits(self):
+        with LibMath.Context(digits=3):
+            self.assertEqual(LibMath.div(1, 3), 0.333)
+            with LibMath.Context(digits=5):
+                self.assertEqual(LibMath.div(1, 3), 0.33333)
+            self.assertEqual(LibMath.root(2, 2), 1.414)
+        self.assertEqual(LibMath.div(1, 3), 0.3333333333)
+
+    def test_context_decimal_backend(self):
+        with LibMath.Context(digits=20, backend=Decimal):
+            self.assertEqual(LibMath.div(1, 3), Decimal("0.33333333333333333333"))
+            self.assertEqual(LibMath.root(2, 2), Decimal("1.41421356237309504880"))
+            self.assertEqual(LibMath.add(Decimal("0.1"), Decimal("0.2")), Decimal("0.3"))
+
+    def test_context_decimal_more_digits_than_precision(self):
+        with LibMath.Context(digits=40, backend=Decimal):
+            self.assertEqual(LibMath.div(1, 3), Decimal("0." + "3" * 40))
+            self.assertEqual(LibMath.root(2, 2), Decimal("1.4142135623730950488016887242096980785697"))
+            self.assertEqual(LibMath.root(Decimal("2.25"), Decimal("0.5")), Decimal("5.0625"))
+            self.assertEqual(LibMath.power(Decimal("1.1"), 50), Decimal("117.3908528796953165066664959903583199389821"))
+            self.assertEqual(LibMath.mul(Decimal("1.5"), 10**40), 15 * 10**39)
+        with LibMath.Context(digits=2, backend=Decimal):
+            self.assertEqual(LibMath.add(Decimal(10**40), Decimal("0.5")), Decimal("1" + "0" * 40 + ".5"))
+            self.assertEqual(LibMath.sub(Decimal("0.25"), 10**40), Decimal("-" + "9" * 40 + ".75"))
+            self.assertEqual(LibMath.add(Decimal("Infinity"), 1), Decimal("Infinity"))
+            with self.assertRaises(InvalidOperation):
+                LibMath.sub(Decimal("Infinity"), Decimal("Infinity"))
+
+    def test_context_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            LibMath.Context(backend=int)
+
+    def test_context_per_thread(self):
+        results = dict()
+
+        def worker(places):
+            with LibMath.Context(digits=places):
+                for i in range(1000):
+                    results[places] = LibMath.div(2, 3)
+
+        threads = [threading.Thread(target=worker, args=(places,)) for places in range(1, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for places in range(1, 8):
+            self.assertEqual(results[places], round(2 / 3, places))
+
+
+# Tests of NumPy variants of the functions (LibMath.vec)
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestVec(unittest.TestCase):
+
+    def test_vec_matches_scalar_functions(self):
+        a = [10, -5, 2.5, 0, 15.88]
+        b = [5, 3, -0.5, 7, -33.1259]
+        for name in ["add", "sub", "mul", "div"]:
+            with self.subTest(name=name):
+                result = getattr(LibMath.vec, name)(np.array(a), np.array(b))
+                expected = [getattr(LibMath, name)(x, y) for x, y in zip(a, b)]
+                np.testing.assert_allclose(result, expected)
+
+    def test_vec_power_and_root(self):
+        np.testing.assert_allclose(LibMath.vec.power(np.array([2, -2.5, 0]), np.array([4, 5, 3])), [16, -97.65625, 0])
+        np.testing.assert_allclose(LibMath.vec.root(np.array([16, -8, 155]), np.array([2, 3, 5])), [4, -2, 2.741992987], 1e-9)
+        np.testing.assert_allclose(LibMath.vec.root(np.array([0.2, -0.2]), -0.2), [3125, -3125])
+        self.assertEqual(list(LibMath.vec.abs(np.array([-1, 2, -15.458]))), [1, 2, 15.458])
+
+    def test_vec_large_integers(self):
+        np.testing.assert_allclose(LibMath.vec.power(np.array([10]), 20), [1e20])
+        np.testing.assert_allclose(LibMath.vec.mul(np.array([2**40]), np.array([2**40])), [2.0**80])
+        np.testing.assert_allclose(LibMath.vec.add(np.array([2**62]), np.array([2**62])), [2.0**63])
+        np.testing.assert_allclose(LibMath.vec.sub(np.array([-2**62]), np.array([2**62])), [-2.0**63])
+        np.testing.assert_equal(LibMath.vec.power(np.array([2]), 2000), [np.inf])
+
+    def test_vec_mod(self):
+        self.assertEqual(list(LibMath.vec.mod(np.array([7, -7, 9]), np.array([3, 3, -4]))), [1, 2, -3])
+        with self.assertRaises(ValueError):
+            LibMath.vec.mod(np.array([7.5]), np.array([2]))
+        np.testing.assert_equal(LibMath.vec.mod(np.array([7.0, 7.5, 4.0]), np.array([3, 2, 0]), errors="nan"), [1, np.nan, np.nan])
+
+    def test_vec_fact(self):
+        np.testing.assert_equal(LibMath.vec.fact(np.array([0, 5, 10.0])), [1, 120, 3628800])
+        np.testing.assert_equal(LibMath.vec.fact(np.array([171, -1, 2.5]), errors="nan"), [np.inf, np.nan, np.nan])
+        with self.assertRaises(ValueError):
+            LibMath.vec.fact(np.array([3, -1]))
+
+    def test_vec_domain_errors_raise(self):
+        with self.assertRaises(ZeroDivisionError):
+            LibMath.vec.div(np.array([1, 2]), np.array([1, 0]))
+        with self.assertRaises(ValueError):
+            LibMath.vec.root(np.array([4, -4]), 2)
+        with self.assertRaises(ValueError):
+            LibMath.vec.root(np.array([4]), 0)
+        with self.assertRaises(ValueError):
+            LibMath.vec.power(np.array([0, 2]), np.array([0, 2]))
+        with self.assertRaises(ValueError):
+            LibMath.vec.power(np.array([2]), np.array([-1]))
+
+    def test_vec_domain_errors_nan_and_mask(self):
+        result = LibMath.vec.div(np.array([1, 2]), np.array([4, 0]), errors="nan")
+        self.assertEqual(result[0], 0.25)
+        self.assertTrue(np.isnan(result[1]))
+        result = LibMath.vec.root(np.array([4, -4, 27]), np.array([2, 2, 3]), errors="mask")
+        self.assertEqual(list(result.mask), [False, True, False])
+        self.assertEqual(list(result.compressed()), [2, 3])
+        with self.assertRaises(ValueError):
+            LibMath.vec.div(np.array([1]), np.array([1]), errors="ignore")
+
+    def test_vec_nan_operands_stay_nan(self):
+        np.testing.assert_equal(LibMath.vec.power(np.nan, 0, "nan"), np.nan)
+        np.testing.assert_equal(LibMath.vec.power(1, np.array([np.nan, 2]), "nan"), [np.nan, 1])
+        np.testing.assert_equal(LibMath.vec.root(1, np.nan, "nan"), np.nan)
+        np.testing.assert_equal(LibMath.vec.root(np.array([np.nan, 4]), np.inf, "nan"), [np.nan, 1])
+        self.assertEqual(list(LibMath.vec.power(np.array([np.nan, 2]), 0, "mask").mask), [True, False])
+
 # to simplify testing
 if __name__ == '__main__':
     unittest.main()
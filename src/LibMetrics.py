@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: LibMetrics.py
+# Authors: Vilem Gottwald
+# Description: Opt-in call counters and timers of LibMath and LibProcExpr
+###################################################################
+
+##
+# @file LibMetrics.py
+#
+# @author Vilem Gottwald
+#
+# @brief Opt-in call counters and timers of LibMath functions and stages of LibProcExpr
+# Instrumentation is switched on by enable(), or by setting environment variable
+# GAPACALC_METRICS=1 before LibProcExpr is imported. It replaces the measured functions
+# with wrappers, disable() puts the original functions back, so there is no overhead when it's off.
+#
+# For every function the number of calls, cumulative time (in seconds) and histogram of argument
+# sizes are recorded. Size of a number is the bit length of its integer part, size of a string
+# or list is its length; histogram buckets are powers of two (bucket 8 counts sizes 5 to 8).
+#
+
+import functools
+import json
+import math
+import threading
+import time
+import LibMath
+
+## measured functions of LibMath
+math_functions = ["add", "sub", "mul", "div", "mod", "fact", "power", "powmod", "root"]
+
+## measured stages of LibProcExpr (name of the stage: function)
+## compiled expressions use scan and compile, the checked stages are used by evaluate_expr and solve_or_error,
+## tokenize and compile_checked by Preview (compile_checked calls compile as well)
+expr_stages = {
+    "solve_expr": "solve_expr",
+    "evaluate_expr": "evaluate_expr",
+    "tokenize": "tokenize",
+    "scan": "scan_expr",
+    "compile": "compile_scanned",
+    "compile_checked": "compile_checked",
+    "evaluate": "run_program",
+    "evaluate_checked": "run_checked",
+    "reduce": "reduce_expr",
+}
+
+## True when the instrumentation is on
+enabled = False
+
+## recorded data, name: {"calls", "time", "sizes"}
+records = dict()
+
+## replaced functions as (module, attribute name, original function)
+originals = list()
+
+lock = threading.Lock()
+
+##
+# @brief Function that computes size of the largest argument
+#
+# @param args Arguments of the call
+#
+# @return Size as described in the file description
+def arg_size(args):
+    size = 0
+    for arg in args:
+        if isinstance(arg, int):
+            arg_len = (arg if arg >= 0 else -arg).bit_length()
+        elif isinstance(arg, float):
+            arg_len = int(arg if arg >= 0 else -arg).bit_length() if math.isfinite(arg) else 0
+        elif hasattr(arg, "__len__"):
+            arg_len = len(arg)
+        else:
+            arg_len = 0
+        size = max(size, arg_len)
+    return size
+
+##
+# @brief Function that replaces function of a module by a measuring wrapper
+#
+# @param module Module containing the function
+# @param attr Name of the function in the module
+# @param name Name the data are recorded under
+def instrument(module, attr, name):
+    func = getattr(module, attr)
+    record = records.setdefault(name, {"calls": 0, "time": 0.0, "sizes": dict()})
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # measured before the call, some functions (e.g. reduce_expr) shrink their arguments
+        size = arg_size(args)
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            bucket = 1 << (size - 1).bit_length() if size > 0 else 0
+            with lock:
+                record["calls"] += 1
+                record["time"] += elapsed
+                record["sizes"][bucket] = record["sizes"].get(bucket, 0) + 1
+
+    originals.append((module, attr, func))
+    setattr(module, attr, wrapper)
+
+##
+# @brief Function that switches the instrumentation on
+def enable():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    # LibProcExpr may enable the instrumentation itself while being imported here
+    import LibProcExpr
+
+    for name in math_functions:
+        instrument(LibMath, name, name)
+    for name, attr in expr_stages.items():
+        instrument(LibProcExpr, attr, name)
+
+##
+# @brief Function that switches the instrumentation off, recorded data are kept
+def disable():
+    global enabled
+    while originals:
+        module, attr, func = originals.pop()
+        setattr(module, attr, func)
+    enabled = False
+
+##
+# @brief Function that deletes all recorded data
+def reset():
+    with lock:
+        for record in records.values():
+            record["calls"] = 0
+            record["time"] = 0.0
+            record["sizes"].clear()
+
+##
+# @brief Function that returns copy of the recorded data
+#
+# @return Dictionary name: {"calls": int, "time": float, "sizes": {bucket: count}}
+def snapshot():
+    with lock:
+        return {name: {"calls": record["calls"], "time": record["time"], "sizes": dict(record["sizes"])}
+                for name, record in records.items()}
+
+##
+# @brief Function that dumps the recorded data as JSON
+#
+# @param file Text stream the data are written to, if given
+#
+# @return JSON string
+def dump_json(file=None):
+    data = json.dumps({"enabled": enabled, "functions": snapshot()}, indent=2, sort_keys=True)
+    if file is not None:
+        file.write(data)
+    return data
+
+# End of file LibMetrics.py
@@ -7,6 +7,14 @@
 #              this library uses mathematical functions from LibMath
 ###################################################################
 
+import os
+import re
+import threading
+from contextlib import nullcontext
+from functools import partial
+from itertools import accumulate
+from collections import OrderedDict, namedtuple
+from decimal import Decimal, InvalidOperation
 import LibMath as math
 
 ##
@@ -17,24 +25,91 @@ import LibMath as math
 # @brief Library for processing mathematical expression, given by GUI
 # This library uses functions from LibMath library to solve mathematical expression given as a string.
 #
+# Valid expressions have the same result with every engine. When an expression contains several errors,
+# the engines may report different ones: the linear and optimized engines (and evaluate_expr) report
+# an expression in wrong format by ValueError before computing anything, then the first failing operation
+# in the order of evaluation (from left to right). The legacy engine computes one operator group after
+# another, so e.g. "1/0+0.5^1.5" raises ValueError of the power instead of ZeroDivisionError, and some
+# wrong formats (e.g. "2-+") raise IndexError.
+#
 
 ##
 # @brief Function that converts number in any format into the corresponding format
+# Strings are converted to the number type (backend) of the current LibMath context.
 #
 # @param num Number that is converted
 #
-# @return Number as float or integer, depending on it's value
+# @exception ValueError if string isn't a number
+#
+# @return Number as float, Decimal or integer, depending on it's value
 def conv_to_num(num):
     if isinstance(num, str):
-        num = float(num)
+        if math.getcontext().backend is Decimal:
+            try:
+                num = Decimal(num)
+            except InvalidOperation:
+                raise ValueError("Error - " + repr(num) + " isn't a number") from None
+        else:
+            num = float(num)
 
     if isinstance(num, int):
         return num
     elif isinstance(num, float):
         return int(num) if num.is_integer() else num
+    elif isinstance(num, Decimal):
+        return int(num) if num.is_finite() and num == num.to_integral_value() else num
     else:
         raise TypeError("Error - wrong parameter type")
 
+##
+# @brief Function that negates number of an expression
+# Decimal numbers are negated exactly, not rounded to the precision of the decimal module.
+#
+# @param num Number
+#
+# @return Negated number
+def negative(num):
+    return num.copy_negate() if num.__class__ is Decimal else -num
+
+## operators recognised in expressions
+operators_l = ["!", "^", "√", "*", "/", "%", "+", "-"]
+operators_s = frozenset(operators_l)
+
+## regular expression matching one item of expression, either an operator or everything between operators
+token_re = re.compile(r"([!^√*/%+-])|([^!^√*/%+-]+)")
+
+## the same as token_re, without groups, so findall returns the items as strings
+item_re = re.compile(r"[!^√*/%+-]|[^!^√*/%+-]+")
+
+##
+# @brief Item of mathematical expression
+# kind is "op" for operators, "num" for numbers and "invalid" for text that isn't a number,
+# value is the number for "num" items (None otherwise) and offset is position of the item in the expression.
+Token = namedtuple("Token", ["kind", "text", "value", "offset"])
+
+##
+# @brief Function that splits mathematical expression into typed items in a single pass
+#
+# @param expression String containing mathematical expression
+#
+# @return List of Token items
+def tokenize(expression):
+    if not isinstance(expression, str):
+        expression = "".join(expression)
+
+    tokens = list()
+    append = tokens.append
+    for match in token_re.finditer(expression):
+        op, num_str = match.groups()
+        if op is not None:
+            append(Token("op", op, None, match.start()))
+            continue
+        try:
+            append(Token("num", num_str, conv_to_num(num_str), match.start()))
+        except ValueError:
+            append(Token("invalid", num_str, None, match.start()))
+    return tokens
+
 ##
 # @brief Function that separates string containing mathematical expression into individual items
 #
@@ -42,44 +117,24 @@ def conv_to_num(num):
 #
 # @return List containing expression items
 def parse_expr(expression):
-    operators_l = ["!", "^", "√", "*", "/", "%", "+", "-"]
-    separated = list()
-    number = True
-    num_str = ""
-
-    for char in expression:
-        for op in operators_l:
-            if char == op:
-                number = False
-                break
-
-        if number:
-            num_str += char
-        else:
-            if num_str != "":
-                separated.append(num_str)
-                num_str = ""
-            separated.append(op)
-            number =  True
-    if num_str != "":
-            separated.append(num_str)
-
-    return separated
+    if not isinstance(expression, str):
+        expression = "".join(expression)
+    return item_re.findall(expression)
 
 ##
-# @brief Function that solves parsed mathematical expression and returns result
+# @brief Function that reduces separated mathematical expression to its result
+# The list is reduced in place, one operator group after another.
 #
-# @param expression Mathematical expression to be solved (as a list of items)
+# @param parsed_expr Mathematical expression as a list of items (output of parse_expr)
 #
 # @return Result of the expression
-def solve_expr(expression):
+def reduce_expr(parsed_expr):
     operators = [["!"], ["^", "√"], ["*", "/", "%"], ["+", "-"]]
-    parsed_expr = parse_expr(expression)
 
     if parsed_expr[0] == "+":
         del parsed_expr[0]
     elif parsed_expr[0] == "-":
-        parsed_expr[1] = - conv_to_num(parsed_expr[1])
+        parsed_expr[1] = negative(conv_to_num(parsed_expr[1]))
         del parsed_expr[0]
 
     for op_group in operators:
@@ -103,13 +158,9 @@ def solve_expr(expression):
 
                 elif parsed_expr[i] == "√" :
 
-                    try:
+                    # root has a degree if it follows a number, otherwise it's a square root
+                    if i != 0 and parsed_expr[i - 1] not in operators_l:
                         degree = conv_to_num(parsed_expr[i - 1])
-                        num = True
-                    except ValueError:
-                        num = False
-
-                    if num and i != 0:
                         base = conv_to_num(parsed_expr[i + 1])
                         parsed_expr[i - 1] = (math.root(base, degree))
                         del parsed_expr[i + 1]
@@ -192,4 +243,1102 @@ def solve_expr(expression):
         raise ValueError("Error - expression in wrong format")
     return conv_to_num(parsed_expr[0])
 
+##
+# @brief Functions of the binary operators used by run_program
+# Operands are taken in the order they were pushed, the root operator receives degree first.
+binary_ops = {
+    "^": lambda a, b: math.power(a, b),
+    "√": lambda a, b: math.root(b, a),
+    "*": lambda a, b: math.mul(a, b),
+    "/": lambda a, b: math.div(a, b),
+    "%": lambda a, b: math.mod(a, b),
+    "+": lambda a, b: math.add(a, b),
+    "-": lambda a, b: math.sub(a, b),
+}
+
+##
+# @brief Function that splits mathematical expression into operators and numbers, for compile_scanned
+# Numbers are converted to the given number type (backend).
+#
+# @param expression String containing mathematical expression
+# @param backend Number type of non-integer numbers, the backend of the current context by default
+#
+# @return (texts, values, positions), texts are operators (None for numbers), values are numbers
+#         (None for operators and text that isn't a number) and positions are offsets of the items
+#         with the end of the expression appended
+def scan_expr(expression, backend=None):
+    texts = item_re.findall(expression)
+    positions = list(accumulate(map(len, texts), initial=0))
+    values = [None] * len(texts)
+    decimal = (backend or math.getcontext().backend) is Decimal
+    for i, text in enumerate(texts):
+        if text in operators_s:
+            continue
+        texts[i] = None
+        try:
+            if decimal:
+                values[i] = conv_to_num(Decimal(text))
+            else:
+                value = float(text)
+                values[i] = int(value) if value.is_integer() else value
+        except (ValueError, InvalidOperation):
+            pass
+    return texts, values, positions
+
+##
+# @brief Function that translates items of expression into a program in postfix order, without raising exceptions
+# See compile_scanned.
+#
+# @param tokens List of Token items (output of tokenize)
+#
+# @return (program, offsets of its items, offset of the first wrong item or None if the format is right)
+def compile_checked(tokens):
+    texts = [token.text if token.kind == "op" else None for token in tokens]
+    values = [token.value for token in tokens]
+    positions = [token.offset for token in tokens]
+    positions.append(tokens[-1].offset + len(tokens[-1].text) if tokens else 0)
+    return compile_scanned(texts, values, positions)
+
+##
+# @brief Function that translates items of expression (output of scan_expr) into a program in postfix order,
+# without raising exceptions
+# Expression is read once from left to right, operator precedence and the handling of signs
+# is the same as in reduce_expr. Prefix square root is translated as root of degree 2.
+# Every item of the program gets the offset of the item it comes from, so errors found when
+# the program is run can be reported at their position in the expression. Fused operator "^%"
+# gets offsets of both its operators.
+#
+# @param texts Operators of the expression, None for numbers (the list is extended)
+# @param values Numbers of the expression, None for operators and wrong numbers (the list is extended)
+# @param positions Offsets of the items and the end of the expression
+#
+# @return (program, offsets of its items, offset of the first wrong item or None if the format is right)
+def compile_scanned(texts, values, positions):
+    count = len(texts)
+    texts.append(None)
+    values.append(None)
+    program = list()
+    offsets = list()
+    emit = program.append
+    emit_offset = offsets.append
+    # index of the item where the format went wrong
+    failed = list()
+
+    # number followed by any number of factorials, -1 if there is no number
+    def primary(i, negate=False):
+        value = values[i]
+        if value is None:
+            failed.append(i)
+            return -1
+        emit(negative(value) if negate else value)
+        emit_offset(positions[i])
+        i += 1
+        while texts[i] == "!":
+            emit("!")
+            emit_offset(positions[i])
+            i += 1
+        return i
+
+    # powers and roots, evaluated from left to right
+    def power_term(i, negate=False):
+        if texts[i] == "√":
+            start = i
+            emit(2)
+            emit_offset(positions[start])
+            i = primary(i + 1)
+            if i < 0:
+                return i
+            emit("√")
+            emit_offset(positions[start])
+        else:
+            i = primary(i, negate)
+        while i >= 0 and (texts[i] == "^" or texts[i] == "√"):
+            op = i
+            i = primary(i + 1)
+            if i >= 0:
+                emit(texts[op])
+                emit_offset(positions[op])
+        return i
+
+    # multiplication, division and modulo, evaluated from left to right
+    # power directly followed by modulo is fused into modular exponentiation "^%"
+    def product_term(i, negate=False):
+        i = power_term(i, negate)
+        if i >= 0 and texts[i] == "%" and program[-1] == "^":
+            op = i
+            program.pop()
+            power_offset = offsets.pop()
+            i = power_term(i + 1)
+            if i >= 0:
+                emit("^%")
+                emit_offset((power_offset, positions[op]))
+        while i >= 0 and (texts[i] == "*" or texts[i] == "/" or texts[i] == "%"):
+            op = i
+            i = power_term(i + 1)
+            if i >= 0:
+                emit(texts[op])
+                emit_offset(positions[op])
+        return i
+
+    i = 0
+    negate = False
+    if texts[0] == "+":
+        i = 1
+    elif texts[0] == "-":
+        if texts[1] is not None:
+            return program, offsets, positions[1]
+        i = 1
+        negate = True
+
+    i = product_term(i, negate)
+    # chains of signs between terms are merged into a single addition or subtraction
+    while i >= 0 and (texts[i] == "+" or texts[i] == "-"):
+        op = i
+        minus = False
+        while texts[i] == "+" or texts[i] == "-":
+            minus ^= texts[i] == "-"
+            i += 1
+        i = product_term(i)
+        if i >= 0:
+            emit("-" if minus else "+")
+            emit_offset(positions[op])
+
+    if failed:
+        return program, offsets, positions[failed[0]]
+    if i != count:
+        return program, offsets, positions[i]
+    return program, offsets, None
+
+##
+# @brief Function that translates items of expression into a program in postfix order
+# See compile_checked.
+#
+# @param tokens List of Token items (output of tokenize)
+#
+# @exception ValueError if expression is in wrong format
+#
+# @return List of numbers and operators in postfix order
+def compile_program(tokens):
+    program, offsets, error = compile_checked(tokens)
+    if error is not None:
+        raise ValueError("Error - expression in wrong format")
+    return program
+
+##
+# @brief Function that computes power followed by modulo (operator "^%" of a compiled program)
+# Integer bases use modular exponentiation. Other bases are raised to the power first and the result
+# is normalized by conv_to_num, as when the operators are evaluated one after another (1.5^0%2 is 1).
+#
+# @param a Base
+# @param exp Exponent
+# @param m Divisor
+#
+# @return Result normalized by conv_to_num
+def power_mod(a, exp, m):
+    if isinstance(a, int):
+        return conv_to_num(math.powmod(a, exp, m))
+    return conv_to_num(math.mod(conv_to_num(math.power(a, exp)), m))
+
+##
+# @brief Function that evaluates program created by compile_program
+# Operator "^%" takes base, exponent and divisor. Every intermediate result is normalized by conv_to_num, as in reduce_expr.
+#
+# @param program List of numbers and operators in postfix order
+#
+# @return Result of the program
+def run_program(program):
+    stack = list()
+    push = stack.append
+    pop = stack.pop
+    ops = binary_ops
+
+    for item in program:
+        if item.__class__ is not str:
+            push(item)
+        elif item == "!":
+            stack[-1] = conv_to_num(math.fact(stack[-1]))
+        elif item == "^%":
+            divisor = pop()
+            exponent = pop()
+            stack[-1] = power_mod(stack[-1], exponent, divisor)
+        else:
+            operand2 = pop()
+            result = ops[item](stack[-1], operand2)
+            # conv_to_num, inlined for results of the default backend
+            if result.__class__ is float:
+                if result.is_integer():
+                    result = int(result)
+            elif result.__class__ is not int:
+                result = conv_to_num(result)
+            stack[-1] = result
+    return stack[0]
+
+##
+# @brief Free variable in a compiled program, negated by a leading minus sign
+#
+class Variable:
+    def __init__(self, sign=1):
+        self.sign = sign
+
+    def __neg__(self):
+        return Variable(-self.sign)
+
+    def __repr__(self):
+        return "Variable(%d)" % (self.sign,)
+
+##
+# @brief Function that applies operator of a compiled program to scalar operands, as run_program does
+#
+# @param op Operator of the program
+# @param args List of operands
+#
+# @return Result normalized by conv_to_num
+def apply_op(op, args):
+    if op == "!":
+        return conv_to_num(math.fact(args[0]))
+    if op == "^%":
+        return power_mod(args[0], args[1], args[2])
+    return conv_to_num(binary_ops[op](args[0], args[1]))
+
+##
+# @brief Result of an evaluation that doesn't raise exceptions
+# kind is None when the expression was solved and value is its result. Otherwise value is None,
+# kind is a key of error_types, message describes the error and offset is its position in the expression.
+#
+class Outcome(namedtuple("Outcome", ["value", "kind", "message", "offset"])):
+    __slots__ = ()
+
+    ## True if the expression was solved
+    @property
+    def ok(self):
+        return self.kind is None
+
+    ##
+    # @brief Creates the exception solve_expr raises for this error
+    #
+    # @return Exception or None if the expression was solved
+    def exception(self):
+        if self.kind is None:
+            return None
+        return error_types[self.kind](self.message)
+
+## exception types of the kinds of errors, "syntax" is wrong format of the expression, "domain" an operand out of domain
+error_types = {
+    "syntax": ValueError,
+    "domain": ValueError,
+    "zero_division": ZeroDivisionError,
+    "overflow": OverflowError,
+    "invalid_operation": InvalidOperation,
+    "arithmetic": ArithmeticError,
+}
+
+##
+# @brief Function that returns kind of error of an exception
+#
+# @param error ArithmeticError or ValueError
+#
+# @return Key of error_types
+def error_kind(error):
+    if isinstance(error, ZeroDivisionError):
+        return "zero_division"
+    if isinstance(error, OverflowError):
+        return "overflow"
+    if isinstance(error, ValueError):
+        return "domain"
+    if isinstance(error, InvalidOperation):
+        return "invalid_operation"
+    return "arithmetic"
+
+##
+# @brief Function that checks operands of an operator against the rules of LibMath
+# The checks are done in the same order as in LibMath, so the error is the one LibMath would raise.
+# Operator "^%" is checked as modular exponentiation, which power_mod uses only for integer bases.
+#
+# @param op Operator of the program
+# @param args List of operands
+#
+# @return (kind, message) if the operands are out of domain of the operator, None otherwise
+def domain_error(op, args):
+    if op == "!":
+        if not isinstance(args[0], int) or args[0] < 0:
+            return "domain", "Factorial error - number isn't integer or is smaller than 0"
+    elif op == "^" or op == "^%":
+        if not isinstance(args[1], int) or args[1] < 0:
+            return "domain", "Power error - exponent is not a natural number"
+        if args[0] == 0 and args[1] == 0:
+            return "domain", "Power error - zero raised to zero ins't defined"
+        if op == "^%":
+            if not (isinstance(args[0], int) and isinstance(args[2], int)):
+                return "domain", "Modulo error - both operands have to be integer"
+            if args[2] == 0:
+                return "zero_division", "Division error - dividing by zero"
+    elif op == "/":
+        if args[1] == 0:
+            return "zero_division", "Division error - dividing by zero"
+    elif op == "%":
+        if not (isinstance(args[0], int) and isinstance(args[1], int)):
+            return "domain", "Modulo error - both operands have to be integer"
+        if args[1] == 0:
+            return "zero_division", "Division error - dividing by zero"
+    elif op == "√":
+        if args[0] % 2 == 0 and args[1] < 0:
+            return "domain", "Root error - even degree of a negative radicant"
+        if args[0] == 0:
+            return "domain", "Root error - degree can't be zero"
+    return None
+
+## operators without domain rules, run_checked computes them without calling domain_error
+unchecked_ops = frozenset(["+", "-", "*"])
+
+##
+# @brief Function that evaluates program created by compile_checked without raising exceptions
+# Operands are checked by domain_error before every operator, so errors of the operands are returned
+# without raising. Arithmetic errors found only while computing (e.g. float overflow) are caught,
+# other exceptions (e.g. TimeoutError of a time limit) are propagated.
+#
+# @param program List of numbers and operators in postfix order
+# @param offsets Offsets of the items of the program in the expression, (power, modulo) pairs for operator "^%"
+#
+# @return Outcome, offset of an error is the offset of the failing operator
+def run_checked(program, offsets):
+    stack = list()
+    push = stack.append
+    pop = stack.pop
+    at = 0
+    try:
+        for k, item in enumerate(program):
+            if item.__class__ is not str:
+                push(item)
+                continue
+            at = offsets[k]
+            if item in unchecked_ops:
+                operand2 = pop()
+                result = binary_ops[item](stack[-1], operand2)
+                # conv_to_num, inlined as in run_program
+                if result.__class__ is float:
+                    if result.is_integer():
+                        result = int(result)
+                elif result.__class__ is not int:
+                    result = conv_to_num(result)
+                stack[-1] = result
+                continue
+            if item == "!":
+                args = (pop(),)
+            elif item == "^%":
+                divisor = pop()
+                exponent = pop()
+                args = (pop(), exponent, divisor)
+                # errors of the power are reported at "^", errors of the modulo at "%"
+                at, modulo_at = offsets[k]
+                error = domain_error("^", args[:2])
+                if error is not None:
+                    return Outcome(None, error[0], error[1], at)
+                if not isinstance(args[0], int):
+                    # power followed by modulo, see power_mod
+                    args = (apply_op("^", args[:2]), divisor)
+                    item = "%"
+                at = modulo_at
+            else:
+                operand2 = pop()
+                args = (pop(), operand2)
+            error = domain_error(item, args)
+            if error is not None:
+                return Outcome(None, error[0], error[1], at)
+            push(apply_op(item, args))
+    except (ArithmeticError, ValueError) as error:
+        return Outcome(None, error_kind(error), str(error), at)
+    return Outcome(stack[0], None, None, None)
+
+##
+# @brief Program created by compile_program with constant sub-expressions folded and identical sub-expressions shared
+# Every sub-expression is stored in a slot. Slots with constants are computed once here, only the remaining
+# steps are executed by run. Steps keep the order of the original program, so the first failing operation
+# (and the raised exception) is the same; sub-expressions that fail aren't folded.
+#
+class OptimizedProgram:
+    ##
+    # @brief Constructor, optimizes the program
+    # Sub-expressions are identified by operator and slots of their operands, so the program is optimized
+    # in linear time; texts of sub-expressions are built only when the report is read.
+    #
+    # @param program List of numbers, Variable objects and operators in postfix order
+    # @param apply Function applying operator to a list of operands, apply_op by default
+    # @param constant Function converting numbers of the program before they are used
+    def __init__(self, program, apply=apply_op, constant=None):
+        self.values = list()
+        # (None, text) for numbers and variables, (operator, slots of operands) for operations
+        self.nodes = list()
+        self.variables = list()
+        self.steps = list()
+        self.operations = 0
+        # slots of folded and shared sub-expressions
+        self.folded = list()
+        self.shared = list()
+        slots = dict()
+        is_constant = list()
+        stack = list()
+
+        def new_slot(key, value, node, constant_value):
+            slots[key] = len(self.values)
+            self.values.append(value)
+            self.nodes.append(node)
+            is_constant.append(constant_value)
+            return slots[key]
+
+        for item in program:
+            if item.__class__ is Variable:
+                key = ("var", item.sign)
+                if key not in slots:
+                    node = (None, "x" if item.sign > 0 else "-x")
+                    self.variables.append((new_slot(key, None, node, False), item.sign))
+                stack.append(slots[key])
+                continue
+            if item.__class__ is not str:
+                key = ("num", item.__class__, repr(item))
+                if key not in slots:
+                    new_slot(key, item if constant is None else constant(item), (None, str(item)), True)
+                stack.append(slots[key])
+                continue
+
+            self.operations += 1
+            arity = 1 if item == "!" else 3 if item == "^%" else 2
+            args = tuple(stack[-arity:])
+            del stack[-arity:]
+
+            key = (item, args)
+            if key in slots:
+                self.shared.append(slots[key])
+            elif all(is_constant[arg] for arg in args):
+                try:
+                    value = apply(item, [self.values[arg] for arg in args])
+                except (ArithmeticError, ValueError):
+                    self.steps.append((new_slot(key, None, key, False), item, args))
+                else:
+                    self.folded.append(new_slot(key, value, key, True))
+            else:
+                self.steps.append((new_slot(key, None, key, False), item, args))
+            stack.append(slots[key])
+
+        self.result = stack[0]
+
+    ##
+    # @brief Description of what was eliminated
+    # Dictionary with the number of operations of the program, number of the remaining steps and lists
+    # of texts of the folded and shared sub-expressions. Folded sub-expressions that are operands
+    # of larger folded ones aren't listed, so the texts are as long as the expression at most.
+    @property
+    def report(self):
+        operands = set()
+        for slot in self.folded:
+            operands.update(self.nodes[slot][1])
+        return {"operations": self.operations, "remaining": len(self.steps),
+                "folded": [self.text(slot) for slot in self.folded if slot not in operands],
+                "shared": [self.text(slot) for slot in self.shared]}
+
+    ##
+    # @brief Builds text of a sub-expression, operations are enclosed in parentheses
+    #
+    # @param slot Slot of the sub-expression
+    #
+    # @return Text of the sub-expression
+    def text(self, slot):
+        parts = list()
+        pending = [slot]
+        while pending:
+            item = pending.pop()
+            if item.__class__ is str:
+                parts.append(item)
+                continue
+            op, args = self.nodes[item]
+            if op is None:
+                parts.append(args)
+            elif op == "!":
+                pending.extend(("!", args[0]))
+            elif op == "^%":
+                pending.extend((")", args[2], "%", args[1], "^", args[0], "("))
+            else:
+                pending.extend((")", args[1], op, args[0], "("))
+        return "".join(parts)
+
+    ##
+    # @brief Evaluates the program
+    #
+    # @param apply Function applying operator to a list of operands, apply_op by default
+    # @param x Value of the variable, if the program has one
+    #
+    # @return Result of the program
+    def run(self, apply=apply_op, x=None):
+        values = list(self.values)
+        for slot, sign in self.variables:
+            values[slot] = x if sign > 0 else -x
+        for slot, op, args in self.steps:
+            values[slot] = apply(op, [values[arg] for arg in args])
+        return values[self.result]
+
+##
+# @brief Bounded cache that discards the least recently used items first
+# Number of items and optionally their total weight (e.g. size) is limited.
+# Keeps count of hits, misses and evictions. Safe to share between threads.
+#
+class LRUCache:
+    ##
+    # @brief Constructor of the cache
+    #
+    # @param maxsize Maximal number of stored items
+    # @param maxweight Maximal total weight of stored items, None for no limit
+    def __init__(self, maxsize=1024, maxweight=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._weights = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    ##
+    # @brief Looks up an item and marks it as the most recently used
+    #
+    # @param key Key of the item
+    # @param default Value returned when the key isn't cached
+    #
+    # @return Cached value or default
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    ##
+    # @brief Stores an item, the least recently used items are evicted when the cache is full
+    # Items heavier than maxweight aren't stored.
+    #
+    # @param key Key of the item
+    # @param value Value of the item
+    # @param weight Weight of the item
+    def put(self, key, value, weight=1):
+        if self.maxweight is not None and weight > self.maxweight:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            self.weight += weight - self._weights.get(key, 0)
+            self._weights[key] = weight
+            while len(self._items) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                evicted, _ = self._items.popitem(last=False)
+                self.weight -= self._weights.pop(evicted)
+                self.evictions += 1
+
+    ##
+    # @brief Removes all items and resets the counters
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._weights.clear()
+            self.hits = self.misses = self.evictions = self.weight = 0
+
+    ##
+    # @brief Returns all items without marking them as used
+    #
+    # @return List of (key, value) pairs, from the least to the most recently used
+    def items(self):
+        with self._lock:
+            return list(self._items.items())
+
+    ##
+    # @brief Returns usage statistics of the cache
+    #
+    # @return Dictionary with hits, misses, evictions, size, maxsize, weight and maxweight
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._items), "maxsize": self.maxsize, "weight": self.weight, "maxweight": self.maxweight}
+
+## largest total length of expressions kept in expr_cache, compiled expression takes tens of bytes per character
+max_cached_chars = 1 << 18
+
+## cache of compiled expressions used by compile_expr and solve_expr, limited by number and total length of expressions
+expr_cache = LRUCache(1024, max_cached_chars)
+
+##
+# @brief Function that normalizes expression, so the same expression typed differently is cached once
+# White space is removed.
+#
+# @param expression Mathematical expression as a string
+#
+# @return Normalized expression
+def normalize_expr(expression):
+    return "".join(expression.split())
+
+##
+# @brief Function that creates key of the result of expression in a cache of results
+# Results depend on the current context, so its backend and number of digits are part of the key.
+#
+# @param expression Mathematical expression as a string
+#
+# @return Hashable key
+def result_key(expression):
+    return (normalize_expr(expression), math.getcontext().backend, math.get_digits())
+
+##
+# @brief Mathematical expression that is parsed once and can be evaluated repeatedly
+# Only the program in postfix order (with offsets of its items) is kept, it's built when the expression
+# is evaluated for the first time. The legacy engine parses the text again on every evaluation.
+#
+class CompiledExpr:
+    ##
+    # @brief Constructor
+    # Numbers are converted to the backend of the current context, even if evaluated in another one.
+    #
+    # @param expression Mathematical expression as a string (or list of its items)
+    def __init__(self, expression):
+        if not isinstance(expression, str):
+            expression = "".join(expression)
+        self.expression = expression
+        self.backend = math.getcontext().backend
+        self.checked = None
+        self.optimized = None
+
+    def __repr__(self):
+        return "CompiledExpr(%r)" % (self.expression,)
+
+    ##
+    # @brief Translates the expression into a program, see compile_scanned
+    #
+    # @return (program, offsets of its items, offset of the first wrong item or None if the format is right)
+    def compile(self):
+        if self.checked is None:
+            self.checked = compile_scanned(*scan_expr(self.expression, self.backend))
+        return self.checked
+
+    ##
+    # @brief Returns the program of the expression
+    #
+    # @exception ValueError if expression is in wrong format
+    #
+    # @return List of numbers and operators in postfix order
+    def program(self):
+        program, offsets, error = self.compile()
+        if error is not None:
+            raise ValueError("Error - expression in wrong format")
+        return program
+
+    ##
+    # @brief Evaluates the compiled expression
+    #
+    # @param engine "linear" evaluates postfix program in a single pass,
+    #               "optimized" evaluates the program with constants folded (see optimize),
+    #               "legacy" reduces the list of items one operator group after another
+    #
+    # @exception ValueError if engine is unknown
+    #
+    # @return Result of the expression
+    def evaluate(self, engine="linear"):
+        if engine == "linear":
+            return run_program(self.program())
+        elif engine == "optimized":
+            return self.optimize().run()
+        elif engine == "legacy":
+            return reduce_expr(parse_expr(self.expression))
+        raise ValueError("Error - unknown engine " + repr(engine))
+
+    ##
+    # @brief Folds constant sub-expressions and shares identical ones, see OptimizedProgram
+    # Folded values depend on the number of digits of the context, so the program is optimized again when it changes.
+    #
+    # @return OptimizedProgram, its report describes what was eliminated
+    def optimize(self):
+        if self.optimized is None or self.optimized[0] != math.get_digits():
+            self.optimized = (math.get_digits(), OptimizedProgram(self.program()))
+        return self.optimized[1]
+
+    ##
+    # @brief Evaluates the compiled expression without raising exceptions, see run_checked
+    #
+    # @return Outcome with the result, or kind, message and offset of the error
+    def check(self):
+        program, offsets, error = self.compile()
+        if error is not None:
+            return Outcome(None, "syntax", "Error - expression in wrong format", error)
+        return run_checked(program, offsets)
+
+##
+# @brief Function that compiles mathematical expression for repeated evaluation
+# Compiled expressions are kept in expr_cache (separately for each backend),
+# so compiling the same text again is only a lookup. Expressions longer than max_cached_chars aren't cached.
+#
+# @param expression Mathematical expression as a string
+# @param cache False to skip expr_cache, for expressions evaluated only once
+#
+# @return CompiledExpr object
+def compile_expr(expression, cache=True):
+    if not cache or not isinstance(expression, str):
+        return CompiledExpr(expression)
+
+    key = (expression, math.getcontext().backend)
+    compiled = expr_cache.get(key)
+    if compiled is None:
+        compiled = CompiledExpr(expression)
+        expr_cache.put(key, compiled, len(expression))
+    return compiled
+
+##
+# @brief Function that solves mathematical expression and returns result
+#
+# @param expression Mathematical expression to be solved
+# @param engine Evaluation engine, "linear" (default), "optimized" or "legacy", see CompiledExpr.evaluate
+# @param context LibMath.Context the expression is solved in, the current context by default
+# @param cache False to skip expr_cache, for expressions solved only once
+#
+# @return Result of the expression
+def solve_expr(expression, engine="linear", context=None, cache=True):
+    with context or nullcontext():
+        if cache or engine != "linear" or not isinstance(expression, str):
+            return compile_expr(expression, cache).evaluate(engine)
+        # expression solved once is compiled without creating CompiledExpr
+        program, offsets, error = compile_scanned(*scan_expr(expression))
+        if error is not None:
+            raise ValueError("Error - expression in wrong format")
+        return run_program(program)
+
+##
+# @brief Function that solves mathematical expression without raising exceptions
+# Errors are found by checks, not by raising and catching exceptions, so invalid expressions
+# take about as long as valid ones.
+#
+# @param expression Mathematical expression as a string
+# @param context LibMath.Context the expression is solved in, the current context by default
+# @param cache False to skip expr_cache, for expressions solved only once
+#
+# @return Outcome with the result, or kind, message and offset of the error
+def evaluate_expr(expression, context=None, cache=True):
+    with context or nullcontext():
+        if cache or not isinstance(expression, str):
+            return compile_expr(expression, cache).check()
+        program, offsets, error = compile_scanned(*scan_expr(expression))
+        if error is not None:
+            return Outcome(None, "syntax", "Error - expression in wrong format", error)
+        return run_checked(program, offsets)
+
+##
+# @brief Function that solves mathematical expression, errors are returned instead of raised
+# The linear engine uses evaluate_expr, so no exception is raised on the way.
+#
+# @param expression Mathematical expression to be solved
+# @param engine Evaluation engine, see solve_expr
+# @param context LibMath.Context the expression is solved in, see solve_expr
+# @param cache False to skip expr_cache, for expressions solved only once
+#
+# @return Result of the expression or the exception describing why it couldn't be solved
+def solve_or_error(expression, engine="linear", context=None, cache=True):
+    try:
+        if engine == "linear" and isinstance(expression, str):
+            outcome = evaluate_expr(expression, context, cache)
+            return outcome.value if outcome.kind is None else outcome.exception()
+        return solve_expr(expression, engine, context, cache)
+    except Exception as error:
+        return error
+
+##
+# @brief Preview of the result of an expression that is being typed
+# Value of the expression up to the last chain of signs between terms is remembered, so when the text
+# is extended, only the part after it is tokenized and evaluated again. Expressions that could take long
+# (factorial of large numbers, intermediate results with too many bits, exact roots of high degree)
+# aren't previewed.
+#
+class Preview:
+    ## largest number whose factorial is previewed
+    fact_limit = 1000
+    ## largest estimated size (in bits) of previewed intermediate results
+    bit_limit = 1 << 16
+    ## largest estimated cost (degree times bits of the scaled radicand) of previewed exact roots
+    root_limit = 1 << 22
+
+    def __init__(self):
+        self.text = ""
+        self.value = None
+
+    ##
+    # @brief Checks whether program contains operations that are too expensive to preview
+    # Sizes of intermediate results are estimated from sizes of their operands (e.g. power of a number
+    # with n bits to exponent e has about n * e bits), without computing them. Factorial is previewed
+    # only for numbers written in the expression. Exact root of degree d iterates about d times on the radicand
+    # scaled by 10^(digits * d), so its cost is estimated as d times the bits of the scaled radicand.
+    #
+    # @param program Program created by compile_checked
+    #
+    # @return True if the program shouldn't be evaluated
+    def expensive(self, program):
+        # (estimated number of bits, the number if it's written in the expression)
+        stack = list()
+        for item in program:
+            if item.__class__ is not str:
+                finite = item.is_finite() if isinstance(item, Decimal) else item == item and abs(item) != float("inf")
+                # operations with NaN or infinity fail or are computed in floating point, they are cheap
+                stack.append((int(abs(item)).bit_length(), item) if finite else (0, None))
+                continue
+            if item == "!":
+                bits, value = stack.pop()
+                if value is None or not isinstance(value, int) or value > self.fact_limit:
+                    return True
+                size = value * value.bit_length()
+            elif item == "^%":
+                divisor = stack.pop()
+                stack.pop()
+                stack.pop()
+                size = divisor[0]
+            else:
+                operand2 = stack.pop()
+                operand1 = stack.pop()
+                if item == "^":
+                    exponent = operand2[1] if operand2[1] is not None else 1 << operand2[0]
+                    size = operand1[0] * int(min(abs(exponent), self.bit_limit + 1))
+                elif item == "√":
+                    size = operand2[0]
+                    if operand1[1] is None:
+                        degree = min(1 << operand1[0], math.int_root_max_degree)
+                    else:
+                        degree = operand1[1]
+                    # other roots are computed in floating point
+                    if (isinstance(degree, int) and abs(degree) <= math.int_root_max_degree
+                            and isinstance(operand2[1], (int, type(None)))):
+                        degree = abs(degree)
+                        scaled = size + degree * max(math.get_digits(), 0) * 10 // 3
+                        if degree * scaled > self.root_limit:
+                            return True
+                elif item == "*":
+                    size = operand1[0] + operand2[0]
+                elif item == "/":
+                    # dividing by a number smaller than one makes the result larger
+                    size = operand1[0] + 64
+                elif item == "%":
+                    size = operand2[0]
+                else:
+                    size = max(operand1[0], operand2[0]) + 1
+            if size > self.bit_limit:
+                return True
+            stack.append((size, None))
+        return False
+
+    ##
+    # @brief Evaluates tokens, optionally appended to an already known value
+    #
+    # @param value Value of the preceding part of the expression or None
+    # @param tokens Tokens to evaluate, starting with a sign when value is given
+    #
+    # @return Result or None if it can't be previewed
+    def evaluate(self, value, tokens):
+        if value is not None:
+            tokens = [Token("num", "", value, -1)] + tokens
+        if not tokens:
+            return None
+        program, offsets, error = compile_checked(tokens)
+        if error is not None or self.expensive(program):
+            return None
+        return run_checked(program, offsets).value
+
+    ##
+    # @brief Computes preview of the expression
+    #
+    # @param expression Mathematical expression as a string, possibly unfinished
+    #
+    # @return Result of the expression or None if it's unfinished, invalid or expensive
+    def update(self, expression):
+        start = 0
+        value = None
+        if self.value is not None and expression.startswith(self.text):
+            start = len(self.text)
+            value = self.value
+        tokens = tokenize(expression[start:])
+        if value is not None and tokens and tokens[0].text not in ("+", "-"):
+            # the remembered part continues differently, e.g. its last number got longer
+            start = 0
+            value = None
+            tokens = tokenize(expression)
+
+        # last sign following a complete term
+        last = None
+        for i in range(1, len(tokens)):
+            if tokens[i].text in ("+", "-") and tokens[i].kind == "op" and \
+                    (tokens[i - 1].kind == "num" or tokens[i - 1].text == "!"):
+                last = i
+        if last is not None:
+            value = self.evaluate(value, tokens[:last])
+            if value is None:
+                self.text, self.value = "", None
+                return None
+            self.text = expression[:start + tokens[last].offset]
+            self.value = value
+            tokens = tokens[last:]
+        return self.evaluate(value, tokens)
+
+## operations of programs evaluated over arrays, each takes two operands and error handling mode
+vector_ops = {
+    "+": lambda a, b, errors: math.vec.add(a, b),
+    "-": lambda a, b, errors: math.vec.sub(a, b),
+    "*": lambda a, b, errors: math.vec.mul(a, b),
+    "/": lambda a, b, errors: math.vec.div(a, b, errors),
+    "%": lambda a, b, errors: math.vec.mod(a, b, errors),
+    "^": lambda a, b, errors: math.vec.power(a, b, errors),
+    "√": lambda a, b, errors: math.vec.root(b, a, errors),
+}
+
+##
+# @brief Function that applies operator of a compiled program to array operands
+#
+# @param op Operator of the program
+# @param args List of operands
+# @param errors Error handling mode of LibMath.vec, "raise" or "nan"
+#
+# @return Result of the operation
+def apply_vector_op(op, args, errors="raise"):
+    if op == "!":
+        return math.vec.fact(args[0], errors)
+    if op == "^%":
+        return math.vec.mod(math.vec.power(args[0], args[1], errors), args[2], errors)
+    return vector_ops[op](args[0], args[1], errors)
+
+##
+# @brief Function that converts number of a compiled program to float, huge integers become infinite
+#
+# @param number Number of the program
+#
+# @return Float
+def vector_constant(number):
+    try:
+        return float(number)
+    except OverflowError:
+        return float("inf") if number > 0 else float("-inf")
+
+##
+# @brief Expression with a free variable, compiled once and evaluated over NumPy arrays of its values
+# Operators follow LibMath.vec, so results are floats rounded to the digits of the current context
+# (factorials larger than the largest float are infinite). Requires NumPy.
+#
+class VectorExpr:
+    ##
+    # @brief Constructor, compiles the expression
+    #
+    # @param expression Mathematical expression as a string
+    # @param variable Name of the free variable
+    #
+    # @exception ValueError if the expression is in wrong format
+    def __init__(self, expression, variable="x"):
+        self.expression = expression
+        self.variable = variable
+        tokens = list()
+        for token in tokenize(expression):
+            if token.kind == "invalid" and token.text.strip() == variable:
+                token = Token("var", token.text, Variable(), token.offset)
+            tokens.append(token)
+        self.program = compile_program(tokens)
+        self.optimized = None
+
+    def __repr__(self):
+        return "VectorExpr(%r, %r)" % (self.expression, self.variable)
+
+    ##
+    # @brief Folds constant sub-expressions and shares identical ones, following evaluations use the result
+    # Folded values depend on the number of digits of the context, so the program is optimized again when it changes.
+    #
+    # @return OptimizedProgram, its report describes what was eliminated
+    def optimize(self):
+        if self.optimized is None or self.optimized[0] != math.get_digits():
+            with math.vec.np.errstate(all="ignore"):
+                optimized = OptimizedProgram(self.program, apply_vector_op, vector_constant)
+            self.optimized = (math.get_digits(), optimized)
+        return self.optimized[1]
+
+    ##
+    # @brief Evaluates the expression for every value of the variable
+    #
+    # @param x Values of the variable (NumPy array or anything np.asarray accepts)
+    # @param errors "nan" puts NaN in place of values breaking a domain rule (e.g. division by zero),
+    #               "mask" masks them in numpy.ma.MaskedArray, "raise" raises the exception instead
+    #
+    # @exception ValueError if errors isn't one of LibMath.vec.error_modes
+    #
+    # @return Float array of results with the shape of x
+    def evaluate(self, x, errors="nan"):
+        vec = math.vec
+        np = vec.np
+        if errors not in vec.error_modes:
+            raise ValueError("Error - unknown error mode " + repr(errors))
+        mode = "raise" if errors == "raise" else "nan"
+        x = np.asarray(x, dtype=float)
+
+        def apply(op, args):
+            return apply_vector_op(op, args, mode)
+
+        with np.errstate(all="ignore"):
+            if self.optimized is not None:
+                result = self.optimize().run(apply, x)
+            else:
+                stack = list()
+                for item in self.program:
+                    if item.__class__ is Variable:
+                        stack.append(x if item.sign > 0 else -x)
+                    elif item.__class__ is not str:
+                        stack.append(vector_constant(item))
+                    else:
+                        arity = 1 if item == "!" else 3 if item == "^%" else 2
+                        args = stack[-arity:]
+                        del stack[-arity:]
+                        stack.append(apply(item, args))
+                result = stack[0]
+
+        result = np.array(np.broadcast_to(result, x.shape), dtype=float)
+        if errors == "mask":
+            return np.ma.masked_invalid(result)
+        return result
+
+## batches smaller than this are solved in the calling process, starting worker processes wouldn't pay off
+min_parallel_batch = 2048
+
+##
+# @brief Function that solves many independent expressions, using a pool of processes for large batches
+# One invalid expression doesn't stop the batch, its exception is stored in place of the result.
+#
+# @param expressions Iterable of mathematical expressions
+# @param workers Number of worker processes, defaults to the number of CPUs
+# @param chunksize Number of expressions sent to a worker at once, computed from batch size by default
+# @param engine Evaluation engine, see solve_expr
+# @param context LibMath.Context the expressions are solved in, the current context by default
+#
+# @return List of results (or exceptions) in the same order as the expressions
+def solve_many(expressions, workers=None, chunksize=None, engine="linear", context=None):
+    expressions = list(expressions)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if context is None:
+        context = math.getcontext()
+
+    if workers <= 1 or len(expressions) < min_parallel_batch:
+        return [solve_or_error(expression, engine, context) for expression in expressions]
+
+    # imported only when needed, it takes a noticeable part of the startup of the calculator
+    from concurrent.futures import ProcessPoolExecutor
+
+    if chunksize is None:
+        chunksize = max(1, len(expressions) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        solve = partial(solve_or_error, engine=engine, context=context)
+        return list(pool.map(solve, expressions, chunksize=chunksize))
+
+# opt-in call counters and timers, see LibMetrics
+if os.environ.get("GAPACALC_METRICS", "") not in ("", "0"):
+    import LibMetrics
+    LibMetrics.enable()
+
 # End of file LibProcExpr.py
@@ -0,0 +1,503 @@
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: LibProcExpr_Tests.py
+# Authors: Vilem Gottwald
+# Description: Test for LibProcExpr.py
+###################################################################
+# Run the tests in directory src:
+# $ python3 LibProcExpr_Tests.py
+#
+
+import unittest
+from decimal import Decimal
+import json
+import LibMath
+import LibMetrics
+import LibProcExpr
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Tests of function solve_expr
+class TestSolveExpr(unittest.TestCase):
+
+    def test_solve_basic_operators(self):
+        self.assertEqual(LibProcExpr.solve_expr("1+2"), 3)
+        self.assertEqual(LibProcExpr.solve_expr("10-4"), 6)
+        self.assertEqual(LibProcExpr.solve_expr("3*4"), 12)
+        self.assertEqual(LibProcExpr.solve_expr("5/2"), 2.5)
+        self.assertEqual(LibProcExpr.solve_expr("7%3"), 1)
+        self.assertEqual(LibProcExpr.solve_expr("2^10"), 1024)
+        self.assertEqual(LibProcExpr.solve_expr("5!"), 120)
+
+    def test_solve_precedence(self):
+        self.assertEqual(LibProcExpr.solve_expr("2+3*4"), 14)
+        self.assertEqual(LibProcExpr.solve_expr("2*3^2"), 18)
+        self.assertEqual(LibProcExpr.solve_expr("3!^2"), 36)
+        self.assertEqual(LibProcExpr.solve_expr("10-3+2"), 9)
+        self.assertEqual(LibProcExpr.solve_expr("2^3^2"), 64)
+
+    def test_solve_root(self):
+        self.assertEqual(LibProcExpr.solve_expr("√16"), 4)
+        self.assertEqual(LibProcExpr.solve_expr("3√27"), 3)
+        self.assertEqual(LibProcExpr.solve_expr("1+√9*2"), 7)
+
+    def test_solve_signs(self):
+        self.assertEqual(LibProcExpr.solve_expr("-5+3"), -2)
+        self.assertEqual(LibProcExpr.solve_expr("+5"), 5)
+        self.assertEqual(LibProcExpr.solve_expr("5--3"), 8)
+        self.assertEqual(LibProcExpr.solve_expr("5+-3"), 2)
+        self.assertEqual(LibProcExpr.solve_expr("5-+-3"), 8)
+        self.assertEqual(LibProcExpr.solve_expr("-2^2"), 4)
+
+    def test_solve_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            LibProcExpr.solve_expr("1/0")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("2*-3")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("5!3")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("1.5%2")
+
+
+# Tests comparing the linear engine with the legacy one
+class TestEngines(unittest.TestCase):
+
+    expressions = ["1+2*3-4/8", "2^3^2", "3!√64", "√4^2", "2^2√16", "√4√16", "-8√4", "5!!/3!",
+                   "4/2%3", "√9%2", "10-3+2*0.5", "7.5-+-2.5", "1--1--1", "0.1+0.2", "3*2√9"]
+
+    def test_engines_same_results(self):
+        for expr in self.expressions:
+            with self.subTest(expr=expr):
+                self.assertEqual(LibProcExpr.solve_expr(expr, "linear"), LibProcExpr.solve_expr(expr, "legacy"))
+
+    def test_engines_same_errors(self):
+        for expr in ["2*-3", "-√4", "2^√4", "√√16", "5!3", "--5", "2^-1", "1.2.3", "!5"]:
+            with self.subTest(expr=expr):
+                with self.assertRaises(ValueError):
+                    LibProcExpr.solve_expr(expr, "linear")
+                with self.assertRaises((ValueError, IndexError)):
+                    LibProcExpr.solve_expr(expr, "legacy")
+
+    def test_engines_error_precedence(self):
+        # the linear engine reports the first failing operation from left to right, see the description of LibProcExpr
+        for expr, linear_error, legacy_error in [("1/0+.5^1.016", ZeroDivisionError, ValueError),
+                                                 ("1/0*0^0", ZeroDivisionError, ValueError),
+                                                 ("2-+", ValueError, IndexError),
+                                                 ("1+", ValueError, IndexError)]:
+            with self.subTest(expr=expr):
+                for engine in ["linear", "optimized"]:
+                    self.assertIs(type(LibProcExpr.solve_or_error(expr, engine)), linear_error)
+                self.assertIs(type(LibProcExpr.evaluate_expr(expr).exception()), linear_error)
+                self.assertIs(type(LibProcExpr.solve_or_error(expr, "legacy")), legacy_error)
+
+    def test_long_expression(self):
+        self.assertEqual(LibProcExpr.solve_expr("+".join(["2*3"] * 5000)), 30000)
+        self.assertEqual(LibProcExpr.solve_expr("-".join(["1"] * 5000)), -4998)
+
+    def test_power_modulo(self):
+        self.assertEqual(LibProcExpr.solve_expr("7^100000%13"), pow(7, 100000, 13))
+        for expr in ["3*2^3%5", "2^3%5*2", "2^3^2%5", "1+2^10%1000%7", "3!^3%7", "2^3%2^2", "1.5^0%2", "0.5^0%7"]:
+            with self.subTest(expr=expr):
+                self.assertEqual(LibProcExpr.solve_expr(expr, "linear"), LibProcExpr.solve_expr(expr, "legacy"))
+        for engine in ["linear", "optimized"]:
+            self.assertEqual(LibProcExpr.solve_expr("1.5^0%2", engine), 1)
+        self.assertEqual(LibProcExpr.evaluate_expr("1.5^0%2").value, 1)
+        self.assertEqual(LibProcExpr.evaluate_expr("2.5^2%3").kind, "domain")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("2.5^2%3")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("0^0%3")
+        with self.assertRaises(ZeroDivisionError):
+            LibProcExpr.solve_expr("2^3%0")
+
+    def test_solve_in_context(self):
+        self.assertEqual(LibProcExpr.solve_expr("1/3", context=LibMath.Context(digits=4)), 0.3333)
+        decimal_context = LibMath.Context(digits=15, backend=Decimal)
+        self.assertEqual(LibProcExpr.solve_expr("0.1+0.2", context=decimal_context), Decimal("0.3"))
+        self.assertEqual(LibProcExpr.solve_expr("1/3", context=decimal_context), Decimal("0.333333333333333"))
+        self.assertEqual(LibProcExpr.solve_expr("0.1+0.2"), 0.3)
+        self.assertIsInstance(LibProcExpr.solve_expr("0.5*4", context=decimal_context), int)
+        decimal_context = LibMath.Context(digits=40, backend=Decimal)
+        self.assertEqual(LibProcExpr.solve_expr("1/3", context=decimal_context), Decimal("0." + "3" * 40))
+        self.assertEqual(LibProcExpr.solve_expr("2√2", context=decimal_context),
+                         Decimal("1.4142135623730950488016887242096980785697"))
+        number = "-0.1234567890123456789012345678901234567"
+        for engine in ["linear", "legacy"]:
+            self.assertEqual(str(LibProcExpr.solve_expr(number, engine, decimal_context)), number)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("1+1", "fast")
+
+
+# Tests of functions tokenize and parse_expr
+class TestTokenize(unittest.TestCase):
+
+    def test_tokenize_kinds_values_and_offsets(self):
+        tokens = LibProcExpr.tokenize("12.5*√4!")
+        self.assertEqual([token.kind for token in tokens], ["num", "op", "op", "num", "op"])
+        self.assertEqual([token.offset for token in tokens], [0, 4, 5, 6, 7])
+        self.assertEqual(tokens[0].value, 12.5)
+        self.assertEqual(tokens[3].value, 4)
+        self.assertIsInstance(tokens[3].value, int)
+
+    def test_tokenize_invalid_number(self):
+        tokens = LibProcExpr.tokenize("1.2.3+1")
+        self.assertEqual(tokens[0].kind, "invalid")
+        self.assertIsNone(tokens[0].value)
+
+    def test_parse_expr_returns_strings(self):
+        self.assertEqual(LibProcExpr.parse_expr("-12+3!"), ["-", "12", "+", "3", "!"])
+        self.assertEqual(LibProcExpr.parse_expr("2^10%7"), ["2", "^", "10", "%", "7"])
+        self.assertEqual(LibProcExpr.parse_expr(""), [])
+
+
+# Tests of compiled expressions and the expression cache
+class TestCompileExpr(unittest.TestCase):
+
+    def setUp(self):
+        LibProcExpr.expr_cache.clear()
+
+    def test_compiled_expr_is_reusable(self):
+        compiled = LibProcExpr.compile_expr("2+3*4")
+        self.assertEqual(compiled.evaluate(), 14)
+        self.assertEqual(compiled.evaluate(), 14)
+
+    def test_cache_hits_and_misses(self):
+        LibProcExpr.solve_expr("1+1")
+        LibProcExpr.solve_expr("1+1")
+        LibProcExpr.solve_expr("2+2")
+        stats = LibProcExpr.expr_cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["size"], 2)
+
+    def test_cache_eviction(self):
+        cache = LibProcExpr.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_cache_items_keep_order(self):
+        cache = LibProcExpr.LRUCache(3)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        self.assertEqual(cache.items(), [("b", 2), ("a", 1)])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_cache_weight_limit(self):
+        cache = LibProcExpr.LRUCache(10, maxweight=10)
+        cache.put("a", 1, 4)
+        cache.put("b", 2, 4)
+        cache.put("c", 3, 4)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.stats()["weight"], 8)
+        cache.put("d", 4, 11)
+        self.assertNotIn("d", cache)
+        self.assertEqual(len(cache.items()), 2)
+
+    def test_long_expression_not_cached(self):
+        expression = "+".join(["1"] * LibProcExpr.max_cached_chars)
+        self.assertEqual(LibProcExpr.solve_expr(expression), LibProcExpr.max_cached_chars)
+        self.assertEqual(LibProcExpr.expr_cache.stats()["size"], 0)
+        LibProcExpr.solve_expr("1+1")
+        self.assertEqual(LibProcExpr.expr_cache.stats()["weight"], 3)
+
+    def test_solve_without_cache(self):
+        self.assertEqual(LibProcExpr.solve_expr("2+3*4", cache=False), 14)
+        self.assertEqual(LibProcExpr.evaluate_expr("1/0", cache=False).offset, 1)
+        self.assertIsInstance(LibProcExpr.solve_or_error("2+", cache=False), ValueError)
+        self.assertRaises(ValueError, LibProcExpr.solve_expr, "2*", cache=False)
+        with LibMath.Context(backend=Decimal):
+            self.assertEqual(LibProcExpr.solve_expr("0.1+0.2", cache=False), Decimal("0.3"))
+        self.assertEqual(LibProcExpr.expr_cache.stats()["size"], 0)
+
+    def test_compiled_expr_is_lazy(self):
+        compiled = LibProcExpr.compile_expr("2+")
+        self.assertIsNone(compiled.checked)
+        self.assertRaises(ValueError, compiled.evaluate)
+        self.assertEqual(compiled.check().offset, 2)
+
+    def test_result_key(self):
+        self.assertEqual(LibProcExpr.normalize_expr(" 2 + 3 *4 "), "2+3*4")
+        self.assertEqual(LibProcExpr.result_key("2 +3"), LibProcExpr.result_key("2+3"))
+        key = LibProcExpr.result_key("1/3")
+        with LibMath.Context(digits=4):
+            self.assertNotEqual(LibProcExpr.result_key("1/3"), key)
+
+
+# Tests of function solve_many
+class TestSolveMany(unittest.TestCase):
+
+    expressions = ["1+1", "1/0", "2^10", "5!3", "3*3"]
+
+    def check_results(self, results):
+        self.assertEqual(results[0], 2)
+        self.assertIsInstance(results[1], ZeroDivisionError)
+        self.assertEqual(results[2], 1024)
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(results[4], 9)
+
+    def test_solve_many_in_process(self):
+        self.check_results(LibProcExpr.solve_many(iter(self.expressions)))
+
+    def test_solve_many_process_pool(self):
+        batch_size = LibProcExpr.min_parallel_batch
+        LibProcExpr.min_parallel_batch = 0
+        try:
+            self.check_results(LibProcExpr.solve_many(self.expressions, workers=2, chunksize=2))
+        finally:
+            LibProcExpr.min_parallel_batch = batch_size
+
+# Tests of constant folding and sharing of sub-expressions
+class TestOptimize(unittest.TestCase):
+
+    def test_optimized_same_results(self):
+        for expr in TestEngines.expressions + ["5!*3+5!*7", "7^100000%13", "-2^2", "2^3%2^2"]:
+            with self.subTest(expr=expr):
+                self.assertEqual(LibProcExpr.solve_expr(expr, "optimized"), LibProcExpr.solve_expr(expr))
+
+    def test_optimized_same_errors(self):
+        for expr, error in [("1+1/0", ZeroDivisionError), ("2*-3", ValueError), ("3!+2.5%2", ValueError)]:
+            with self.subTest(expr=expr):
+                with self.assertRaises(error):
+                    LibProcExpr.solve_expr(expr, "optimized")
+
+    def test_optimized_long_expression(self):
+        expr = "+".join("%d*%d" % (i % 7, i % 5 + 1) for i in range(20000))
+        self.assertEqual(LibProcExpr.solve_expr(expr, "optimized"), LibProcExpr.solve_expr(expr))
+        self.assertEqual(LibProcExpr.compile_expr(expr).optimize().report["remaining"], 0)
+
+    def test_report(self):
+        report = LibProcExpr.compile_expr("5!*3+5!*7").optimize().report
+        self.assertEqual(report["operations"], 5)
+        self.assertEqual(report["remaining"], 0)
+        self.assertEqual(report["shared"], ["5!"])
+        self.assertEqual(report["folded"], ["((5!*3)+(5!*7))"])
+
+    def test_optimize_follows_digits(self):
+        compiled = LibProcExpr.compile_expr("1/3")
+        self.assertEqual(compiled.evaluate("optimized"), 0.3333333333)
+        with LibMath.Context(digits=2):
+            self.assertEqual(compiled.evaluate("optimized"), 0.33)
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_optimized_vector_expr(self):
+        compiled = LibProcExpr.VectorExpr("x^2*3+x^2*7+2^10/3√27+1/x")
+        xs = np.array([-2, 0, 0.5, 3])
+        expected = compiled.evaluate(xs)
+        report = compiled.optimize().report
+        self.assertEqual(report["shared"], ["(x^2)"])
+        self.assertEqual(report["folded"], ["((2^10)/(3√27))"])
+        np.testing.assert_array_equal(compiled.evaluate(xs), expected)
+
+# Tests of evaluation without exceptions (evaluate_expr)
+class TestEvaluateExpr(unittest.TestCase):
+
+    def test_evaluate_results(self):
+        for expr in TestEngines.expressions + ["7^100000%13", "-2^2", "-3√8"]:
+            with self.subTest(expr=expr):
+                outcome = LibProcExpr.evaluate_expr(expr)
+                self.assertTrue(outcome.ok)
+                self.assertEqual(outcome.value, LibProcExpr.solve_expr(expr))
+
+    def test_evaluate_errors(self):
+        cases = [
+            ("1+", "syntax", 2),
+            ("2*-3", "syntax", 2),
+            ("1+abc*2", "syntax", 2),
+            ("5!3", "syntax", 2),
+            ("1+10/0", "zero_division", 4),
+            ("3+2.5!", "domain", 5),
+            ("2^-1", "syntax", 2),
+            ("2^0.5", "domain", 1),
+            ("0^0+1", "domain", 1),
+            ("7^2%0", "zero_division", 3),
+            ("0^0%5", "domain", 1),
+            ("4^0.5%3", "domain", 1),
+            ("1+2.5^2%3", "domain", 7),
+            ("2^3%2.5", "domain", 3),
+            ("1-0√5", "domain", 3),
+            ("4--√abc", "syntax", 4),
+        ]
+        for expr, kind, offset in cases:
+            with self.subTest(expr=expr):
+                outcome = LibProcExpr.evaluate_expr(expr)
+                self.assertFalse(outcome.ok)
+                self.assertIsNone(outcome.value)
+                self.assertEqual((outcome.kind, outcome.offset), (kind, offset))
+                with self.assertRaises(type(outcome.exception())) as raised:
+                    LibProcExpr.solve_expr(expr)
+                self.assertEqual(str(raised.exception), outcome.message)
+
+    def test_solve_or_error_uses_outcome(self):
+        error = LibProcExpr.solve_or_error("1%0")
+        self.assertIsInstance(error, ZeroDivisionError)
+        self.assertEqual(str(error), "Division error - dividing by zero")
+        self.assertEqual(LibProcExpr.solve_or_error("1+2"), 3)
+
+    def test_evaluate_decimal(self):
+        decimal_context = LibMath.Context(digits=15, backend=Decimal)
+        self.assertEqual(LibProcExpr.evaluate_expr("1/3", decimal_context).value, Decimal("0.333333333333333"))
+        outcome = LibProcExpr.evaluate_expr("inf-inf", decimal_context)
+        self.assertEqual((outcome.kind, outcome.offset), ("invalid_operation", 3))
+
+    def test_legacy_root_degree(self):
+        self.assertEqual(LibProcExpr.reduce_expr(["3", "√", "8"]), 2)
+        self.assertEqual(LibProcExpr.reduce_expr(["√", "9", "+", "1"]), 4)
+        self.assertEqual(LibProcExpr.reduce_expr(["2", "*", "√", "9"]), 6)
+
+# Tests of the preview of typed expressions
+class TestPreview(unittest.TestCase):
+
+    def test_preview_while_typing(self):
+        preview = LibProcExpr.Preview()
+        expr = "12+3*4-√9+2^3%5--1"
+        for i in range(len(expr) + 1):
+            with self.subTest(text=expr[:i]):
+                expected = LibProcExpr.solve_or_error(expr[:i])
+                if isinstance(expected, Exception):
+                    expected = None
+                self.assertEqual(preview.update(expr[:i]), expected)
+        self.assertEqual(preview.text, "12+3*4-√9+2^3%5")
+
+    def test_preview_after_editing(self):
+        preview = LibProcExpr.Preview()
+        self.assertEqual(preview.update("2+3+4"), 9)
+        self.assertEqual(preview.update("25+3+4"), 32)
+        self.assertEqual(preview.update("2"), 2)
+        self.assertEqual(preview.update("2+3-"), None)
+
+    def test_preview_skips_expensive_operators(self):
+        preview = LibProcExpr.Preview()
+        self.assertIsNone(preview.update("5000!"))
+        self.assertIsNone(preview.update("3!!"))
+        self.assertIsNone(preview.update("2^100000+1"))
+        self.assertIsNone(preview.update("2^100000+1+1"))
+        self.assertIsNone(preview.update("1000!^9999"))
+        self.assertIsNone(preview.update("99^9999^999"))
+        self.assertIsNone(preview.update("2^200^200"))
+        self.assertEqual(preview.update("2^10^3"), 2**30)
+        self.assertEqual(preview.update("100!*100!"), LibMath.fact(100)**2)
+        for expr in ["2^nan", "2^inf", "nan!", "2^nan%3"]:
+            with self.subTest(expr=expr):
+                self.assertIsNone(preview.update(expr))
+        self.assertEqual(preview.update("inf+1"), float("inf"))
+        with LibMath.Context(backend=Decimal):
+            self.assertIsNone(preview.update("2^nan"))
+        self.assertEqual(preview.update("10!"), 3628800)
+
+    def test_preview_skips_roots_of_high_degree(self):
+        preview = LibProcExpr.Preview()
+        self.assertIsNone(preview.update("1000√2"))
+        self.assertIsNone(preview.update("1+500√7"))
+        self.assertIsNone(preview.update("3!!√2"))
+        self.assertEqual(preview.update("3√27"), 3)
+        self.assertEqual(preview.update("20√2"), LibMath.root(2, 20))
+        self.assertEqual(preview.update("1000.5√2"), LibMath.root(2, 1000.5))
+        self.assertEqual(preview.update("2000√2"), LibMath.root(2, 2000))
+
+# Tests of expressions with a free variable evaluated over arrays
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestVectorExpr(unittest.TestCase):
+
+    def test_vector_matches_solve_expr(self):
+        xs = [0, 0.5, 1, 2, 3, 10.25]
+        for expr in ["2*x^2-3*x+1", "1/x", "√x+x!", "3√x%2", "2^x%5", "x√8", "10-x*x"]:
+            results = LibProcExpr.VectorExpr(expr).evaluate(np.array(xs))
+            for x, result in zip(xs, results):
+                with self.subTest(expr=expr, x=x):
+                    expected = LibProcExpr.solve_or_error(expr.replace("x", repr(x)))
+                    if isinstance(expected, Exception):
+                        self.assertTrue(np.isnan(result))
+                    else:
+                        self.assertAlmostEqual(result, float(expected))
+
+    def test_vector_domain_errors(self):
+        compiled = LibProcExpr.VectorExpr("√x/x")
+        np.testing.assert_equal(compiled.evaluate([-4, 0, 4]), [np.nan, np.nan, 0.5])
+        self.assertEqual(list(compiled.evaluate([-4, 4], errors="mask").mask), [True, False])
+        with self.assertRaises(ValueError):
+            compiled.evaluate([-4, 4], errors="raise")
+
+    def test_vector_domain_errors_propagate(self):
+        for expr in ["√x^0", "√x√1"]:
+            compiled = LibProcExpr.VectorExpr(expr)
+            for optimize in [False, True]:
+                if optimize:
+                    compiled.optimize()
+                with self.subTest(expr=expr, optimize=optimize):
+                    np.testing.assert_equal(compiled.evaluate([-4.0, 4.0]), [np.nan, 1])
+                    self.assertEqual(list(compiled.evaluate([-4.0, 4.0], errors="mask").mask), [True, False])
+                    with self.assertRaises(ValueError):
+                        compiled.evaluate([-4.0], errors="raise")
+
+    def test_vector_leading_sign_and_constants(self):
+        np.testing.assert_equal(LibProcExpr.VectorExpr("-x+1").evaluate([1, 2]), [0, -1])
+        np.testing.assert_equal(LibProcExpr.VectorExpr("2^10").evaluate([1, 2]), [1024, 1024])
+        with self.assertRaises(ValueError):
+            LibProcExpr.VectorExpr("2x")
+        with self.assertRaises(ValueError):
+            LibProcExpr.solve_expr("x+1")
+
+# Tests of opt-in instrumentation (LibMetrics)
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        LibProcExpr.expr_cache.clear()
+        LibMetrics.reset()
+
+    def tearDown(self):
+        LibMetrics.disable()
+
+    def test_metrics_count_calls_and_stages(self):
+        LibMetrics.enable()
+        LibProcExpr.solve_expr("2*3+4*5")
+        LibProcExpr.solve_expr("2*3+4*5")
+        data = LibMetrics.snapshot()
+        self.assertEqual(data["mul"]["calls"], 4)
+        self.assertEqual(data["add"]["calls"], 2)
+        self.assertEqual(data["solve_expr"]["calls"], 2)
+        self.assertEqual(data["scan"]["calls"], 1)
+        self.assertEqual(data["evaluate"]["calls"], 2)
+        self.assertEqual(data["mul"]["sizes"], {2: 2, 4: 2})
+        self.assertEqual(json.loads(LibMetrics.dump_json())["functions"]["add"]["calls"], 2)
+
+    def test_metrics_checked_stages(self):
+        LibMetrics.enable()
+        LibProcExpr.solve_or_error("2*3+4")
+        LibProcExpr.solve_or_error("2*3+4")
+        LibProcExpr.solve_or_error("1/0")
+        data = LibMetrics.snapshot()
+        self.assertEqual(data["evaluate_expr"]["calls"], 3)
+        self.assertEqual(data["scan"]["calls"], 2)
+        self.assertEqual(data["compile"]["calls"], 2)
+        self.assertEqual(data["evaluate_checked"]["calls"], 3)
+        self.assertEqual(data["mul"]["calls"], 2)
+
+    def test_metrics_sizes_before_call(self):
+        LibMetrics.enable()
+        self.assertEqual(LibProcExpr.reduce_expr.__name__, "reduce_expr")
+        LibProcExpr.solve_expr("1+2*3+4", "legacy")
+        self.assertEqual(LibMetrics.snapshot()["reduce"]["sizes"], {8: 1})
+
+    def test_metrics_disabled(self):
+        LibMetrics.enable()
+        LibMetrics.disable()
+        self.assertFalse(hasattr(LibMath.add, "__wrapped__"))
+        LibProcExpr.solve_expr("1+1")
+        self.assertEqual(LibMetrics.snapshot()["add"]["calls"], 0)
+
+# to simplify testing
+if __name__ == '__main__':
+    unittest.main()
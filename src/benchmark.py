@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: benchmark.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: Benchmarks of the mathematical library
+###################################################################
+
+##
+# @file benchmark.py
+#
+# @brief Scaling benchmarks of LibMath, LibProcExpr and profiling.py
+# Inputs of growing size are generated (10 to 10^7 numbers, expressions of 10 to 10^5 items,
+# 10 to 10^5 different short expressions)
+# and the best time of each measurement is written as JSON. Results can be compared
+# with a stored baseline, measurements slower than the tolerance are reported as regressions.
+# Run in directory src:
+# $ python3 benchmark.py --json results.json
+# $ python3 benchmark.py --quick --baseline results.json
+# $ python3 benchmark.py --compare-fact
+#
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import LibMath as math
+import LibProcExpr
+import profiling
+
+##
+# @brief Factorial computed one factor at a time (previous implementation of LibMath.fact)
+#
+# @param a Number, factorial will be computed from
+#
+# @return Factorial of given number
+def fact_loop(a):
+    if a == 0:
+        return 1
+    result = a
+    while a != 1:
+        a -= 1
+        result *= a
+    return result
+
+##
+# @brief Measures the best time of several calls of a function
+#
+# @param func Measured function
+# @param args Arguments of the function
+# @param repeat Number of measurements
+#
+# @return Best time in seconds
+def best_time(func, *args, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+##
+# @brief Compares LibMath.fact with the factorial computed in a loop
+#
+# @param sizes Numbers the factorial is computed from
+# @param out Stream the table is written to
+def compare_fact(sizes=(100, 1000, 10000, 50000), out=sys.stdout):
+    out.write("%8s %12s %12s %9s\n" % ("n", "loop [s]", "fact [s]", "speedup"))
+    for n in sizes:
+        loop = best_time(fact_loop, n)
+        fast = best_time(math.fact, n)
+        out.write("%8d %12.6f %12.6f %8.1fx\n" % (n, loop, fast, loop / fast))
+
+## sizes of the inputs for every benchmark, full and --quick runs
+sizes = {
+    "stddev": [10, 100, 1000, 10**4, 10**5, 10**6, 10**7],
+    "solve_expr": [10, 100, 1000, 10**4, 10**5],
+    "solve_unique": [10, 100, 1000, 10**4, 10**5],
+    "fact": [10, 100, 1000, 10**4, 10**5],
+    "power": [10, 100, 1000, 10**4, 10**5, 10**6],
+    "root": [10, 100, 1000, 10**4],
+}
+quick_sizes = {
+    "stddev": [10, 100, 1000, 10**4, 10**5],
+    "solve_expr": [10, 100, 1000, 10**4],
+    "solve_unique": [10, 100, 1000, 10**4],
+    "fact": [10, 100, 1000, 10**4],
+    "power": [10, 100, 1000, 10**4],
+    "root": [10, 100, 1000],
+}
+
+##
+# @brief Generates expression with given number of items (numbers and operators)
+#
+# @param count Number of items
+# @param generator random.Random object
+#
+# @return Expression as a string
+def generate_expr(count, generator):
+    items = [str(generator.randint(1, 99))]
+    while len(items) + 2 <= count:
+        items.append(generator.choice("+-*/"))
+        items.append(str(generator.randint(1, 99)))
+    return "".join(items)
+
+##
+# @brief Measures standard deviation of n numbers (profiling.stddev on parsed input)
+def bench_stddev(n, generator, repeat):
+    data = profiling.parse_numbers(" ".join(repr(generator.uniform(-1000, 1000)) for i in range(n)))
+    return best_time(profiling.stddev, data, repeat=repeat)
+
+##
+# @brief Measures solving of expression with n items, compiling included
+def bench_solve_expr(n, generator, repeat):
+    expr = generate_expr(n, generator)
+
+    def solve():
+        LibProcExpr.expr_cache.clear()
+        LibProcExpr.solve_expr(expr)
+    return best_time(solve, repeat=repeat)
+
+##
+# @brief Measures solving of n different short expressions, each solved once as cli.py and server.py do
+def bench_solve_unique(n, generator, repeat):
+    exprs = [generate_expr(9, generator) for i in range(n)]
+
+    def solve():
+        for expr in exprs:
+            LibProcExpr.solve_or_error(expr, cache=False)
+    return best_time(solve, repeat=repeat)
+
+##
+# @brief Measures factorial of n
+def bench_fact(n, generator, repeat):
+    return best_time(math.fact, n, repeat=repeat)
+
+##
+# @brief Measures power with exponent n
+def bench_power(n, generator, repeat):
+    return best_time(math.power, 3, n, repeat=repeat)
+
+##
+# @brief Measures cube root of a number with n digits
+def bench_root(n, generator, repeat):
+    radicand = generator.randrange(10**(n - 1), 10**n)
+    return best_time(math.root, radicand, 3, repeat=repeat)
+
+## benchmarked functions by name, each takes input size, random generator and number of measurements
+benchmarks = {
+    "stddev": bench_stddev,
+    "solve_expr": bench_solve_expr,
+    "solve_unique": bench_solve_unique,
+    "fact": bench_fact,
+    "power": bench_power,
+    "root": bench_root,
+}
+
+##
+# @brief Runs the benchmarks
+#
+# @param selected Names of benchmarks to run
+# @param size_table Sizes of the inputs for each benchmark
+# @param repeat Number of measurements, the best one is kept
+# @param log Stream progress is written to
+#
+# @return Dictionary with description of the machine and results keyed by "name/size"
+def run(selected, size_table=sizes, repeat=3, log=sys.stderr):
+    results = dict()
+    for name in selected:
+        for n in size_table[name]:
+            elapsed = benchmarks[name](n, random.Random(n), repeat)
+            results["%s/%d" % (name, n)] = elapsed
+            log.write("%-24s %12.6f s\n" % ("%s/%d" % (name, n), elapsed))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+
+##
+# @brief Compares results with baseline
+#
+# @param current Results of this run (output of run)
+# @param baseline Stored results
+# @param tolerance Allowed relative slowdown, e.g. 0.25 for 25 %
+#
+# @return List of (key, baseline time, current time) of regressions
+def compare(current, baseline, tolerance=0.25):
+    regressions = list()
+    for key, elapsed in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is not None and elapsed > before * (1 + tolerance):
+            regressions.append((key, before, elapsed))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the calculator libraries.")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="benchmarks to run: " + ", ".join(benchmarks) + " (default: all)")
+    parser.add_argument("--quick", action="store_true", help="use smaller inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measurements of each input")
+    parser.add_argument("--json", metavar="FILE", help="write results to FILE instead of standard output")
+    parser.add_argument("--baseline", metavar="FILE", help="compare results with stored results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against baseline")
+    parser.add_argument("--compare-fact", action="store_true", help="compare fact with the old loop and exit")
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark " + repr(name))
+
+    if args.compare_fact:
+        compare_fact()
+        return 0
+
+    current = run(args.names or list(benchmarks), quick_sizes if args.quick else sizes, args.repeat)
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(current, file, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions = compare(current, json.load(file), args.tolerance)
+        for key, before, elapsed in regressions:
+            sys.stderr.write("REGRESSION %s: %.6f s -> %.6f s\n" % (key, before, elapsed))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# End of file benchmark.py
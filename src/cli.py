@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: cli.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: Command line calculator solving expressions line by line
+###################################################################
+
+##
+# @file cli.py
+#
+# @brief Solves expressions from standard input or files, one expression per line
+# Run in directory src:
+# $ echo "1+2*3" | python3 cli.py
+# $ python3 cli.py expressions.txt more.txt > results.txt
+# $ python3 cli.py --format json --workers 4 < expressions.txt
+#
+# For every input line one output line is written, empty lines stay empty. In text format it is
+# the result, or "error<TAB>kind<TAB>message" when the expression can't be solved.
+# In json format it is an object {"line", "expr", "result"} or {"line", "expr", "error", "message"},
+# results that aren't JSON numbers (Decimal, huge integers, NaN and infinite floats) are written as strings.
+#
+# Input is read and output written in batches of lines and every line is solved without
+# LibProcExpr.expr_cache (lines are rarely repeated), so memory doesn't grow with the size
+# of the input. With --line-buffered every line is answered immediately (for interactive use).
+#
+
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import partial
+import LibMath
+import LibProcExpr
+
+## number of lines read, solved and written at once
+batch_size = 8192
+
+##
+# @brief Reads lines from text streams in batches
+#
+# @param streams Iterable of text streams
+# @param size Maximal number of lines in a batch
+#
+# @return Generator of lists of lines without line ends
+def read_batches(streams, size=batch_size):
+    batch = list()
+    for stream in streams:
+        for line in stream:
+            batch.append(line.rstrip("\r\n"))
+            if len(batch) >= size:
+                yield batch
+                batch = list()
+    if batch:
+        yield batch
+
+##
+# @brief Formats result of one expression as text
+#
+# @param number Number of the line
+# @param expr Expression
+# @param result Result or exception
+#
+# @return Output line without line end
+def format_text(number, expr, result):
+    if isinstance(result, Exception):
+        return "error\t%s\t%s" % (type(result).__name__, result)
+    return str(result)
+
+##
+# @brief Formats result of one expression as JSON object
+#
+# @param number Number of the line
+# @param expr Expression
+# @param result Result or exception
+#
+# @return Output line without line end
+def format_json(number, expr, result):
+    fields = {"line": number, "expr": expr}
+    fields.update(result_fields(result))
+    return json.dumps(fields, allow_nan=False)
+
+##
+# @brief Converts result of one expression to JSON fields
+# Results that aren't JSON numbers (Decimal, integers too large for double, NaN and infinite floats)
+# are converted to strings.
+#
+# @param result Result or exception
+#
+# @return Dictionary {"result"} or {"error", "message"}
+def result_fields(result):
+    if isinstance(result, Exception):
+        return {"error": type(result).__name__, "message": str(result)}
+    if isinstance(result, Decimal) or (isinstance(result, int) and result.bit_length() > 53) \
+            or (isinstance(result, float) and not math.isfinite(result)):
+        result = str(result)
+    return {"result": result}
+
+## output formats by name
+formats = {"text": format_text, "json": format_json}
+
+##
+# @brief Solves expressions from the streams and writes results to the output
+#
+# @param streams Iterable of text streams with one expression per line
+# @param out Text stream the results are written to
+# @param fmt Output format, key of formats
+# @param context LibMath.Context the expressions are solved in, the current context by default
+# @param workers Number of worker processes, expressions are solved in this process if 1
+# @param size Number of lines in a batch
+#
+# @return Number of expressions that couldn't be solved
+def run(streams, out, fmt="text", context=None, workers=1, size=batch_size):
+    format_line = formats[fmt]
+    if context is None:
+        context = LibMath.getcontext()
+    solve = partial(LibProcExpr.solve_or_error, context=context, cache=False)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    errors = 0
+    number = 0
+    try:
+        for batch in read_batches(streams, size):
+            if pool is not None:
+                results = pool.map(solve, batch, chunksize=max(1, len(batch) // (workers * 4)))
+            else:
+                results = map(solve, batch)
+
+            lines = list()
+            for expr, result in zip(batch, results):
+                number += 1
+                if not expr.strip():
+                    lines.append("")
+                    continue
+                if isinstance(result, Exception):
+                    errors += 1
+                lines.append(format_line(number, expr, result))
+            lines.append("")
+            out.write("\n".join(lines))
+            if size == 1:
+                out.flush()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return errors
+
+##
+# @brief Opens input files one after another, "-" stands for standard input
+#
+# @param paths Paths of the files
+#
+# @return Generator of text streams
+def open_inputs(paths):
+    for path in paths:
+        if path == "-":
+            yield sys.stdin
+        else:
+            with open(path) as stream:
+                yield stream
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solves expressions, one per line.")
+    parser.add_argument("files", nargs="*", metavar="FILE", help="files with expressions, - for standard input (default)")
+    parser.add_argument("--format", choices=sorted(formats), default="text", help="output format (default: text)")
+    parser.add_argument("--digits", type=int, help="number of digits results are rounded to")
+    parser.add_argument("--decimal", action="store_true", help="compute with decimal numbers instead of floats")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--line-buffered", action="store_true", help="write every result as soon as it's solved")
+    args = parser.parse_args(argv)
+
+    # results of the calculator may have any number of digits
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+
+    context = LibMath.Context(args.digits, Decimal if args.decimal else float)
+    size = 1 if args.line_buffered else batch_size
+    try:
+        errors = run(open_inputs(args.files or ["-"]), sys.stdout, args.format, context, args.workers, size)
+    except BrokenPipeError:
+        # reader of the output exited (e.g. head), the rest of the output is discarded
+        sys.stdout = open(os.devnull, "w")
+        return 0
+    except OSError as error:
+        sys.stderr.write("%s\n" % error)
+        return 2
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# End of file cli.py
@@ -0,0 +1,81 @@
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: cli_Tests.py
+# Authors: Vilem Gottwald
+# Description: Test for cli.py
+###################################################################
+# Run the tests in directory src:
+# $ python3 cli_Tests.py
+#
+
+import unittest
+import io
+import json
+import tracemalloc
+from decimal import Decimal
+import LibMath
+import LibProcExpr
+import cli
+
+
+# Tests of function run
+class TestRun(unittest.TestCase):
+
+    def solve(self, text, **kwargs):
+        out = io.StringIO()
+        errors = cli.run([io.StringIO(text)], out, **kwargs)
+        return out.getvalue(), errors
+
+    def test_results_line_by_line(self):
+        output, errors = self.solve("1+2*3\n\n2^10\n", size=2)
+        self.assertEqual(output, "7\n\n1024\n")
+        self.assertEqual(errors, 0)
+
+    def test_errors_in_text_format(self):
+        output, errors = self.solve("1/0\n5!3\n4")
+        self.assertEqual(output.splitlines(), ["error\tZeroDivisionError\tDivision error - dividing by zero",
+                                               "error\tValueError\tError - expression in wrong format", "4"])
+        self.assertEqual(errors, 2)
+
+    def test_json_format(self):
+        output, errors = self.solve("1+1\n1/0\n", fmt="json", context=LibMath.Context(3, Decimal))
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(lines[0], {"line": 1, "expr": "1+1", "result": 2})
+        self.assertEqual(lines[1]["error"], "ZeroDivisionError")
+        self.assertEqual(lines[1]["line"], 2)
+
+    def test_json_non_finite_results(self):
+        output, errors = self.solve("nan+1\n-inf-1\n", fmt="json")
+        lines = [json.loads(line, parse_constant=self.fail) for line in output.splitlines()]
+        self.assertEqual([line["result"] for line in lines], ["nan", "-inf"])
+
+    def test_several_streams_and_workers(self):
+        out = io.StringIO()
+        streams = [io.StringIO("1+1\n2+2\n"), io.StringIO("3+3\n")]
+        cli.run(streams, out, workers=2, size=2)
+        self.assertEqual(out.getvalue(), "2\n4\n6\n")
+
+    def peak_memory(self, lines):
+        # input is created before the measurement, only memory used by run is counted
+        stream = io.StringIO(("+".join(["1"] * 2000) + "\n") * lines)
+        tracemalloc.start()
+        try:
+            cli.run([stream], io.StringIO(), size=10)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_does_not_grow_with_long_lines(self):
+        LibProcExpr.expr_cache.clear()
+        few = self.peak_memory(20)
+        many = self.peak_memory(200)
+        self.assertLess(many, few * 1.5)
+        self.assertEqual(LibProcExpr.expr_cache.stats()["size"], 0)
+
+    def test_read_batches(self):
+        batches = list(cli.read_batches([io.StringIO("a\nb\r\nc\n")], 2))
+        self.assertEqual(batches, [["a", "b"], ["c"]])
+
+# to simplify testing
+if __name__ == '__main__':
+    unittest.main()
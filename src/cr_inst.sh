@@ -10,8 +10,9 @@
 	cd ../..
 	mv ./gapacalc.desktop ./usr/share/applications
 	mv ./gapacalc.png ./usr/share/pixmaps
-	cp ../gui.py ../LibMath.py ../LibProcExpr.py ../logo.png ./usr/share/gazorpazorp
+	cp ../gui.py ../cli.py ../LibGraph.py ../LibMath.py ../LibMathVec.py ../LibMetrics.py ../LibProcExpr.py ../logo.png ./usr/share/gazorpazorp
 	ln -sf /usr/share/gazorpazorp/gui.py ./usr/bin/gapacalc
+	ln -sf /usr/share/gazorpazorp/cli.py ./usr/bin/gapacalc-cli
 	dpkg-deb --build ./ ../../installer/gapacalc_inst.deb
 	mv  ./usr/share/applications/gapacalc.desktop ./usr/share/pixmaps/gapacalc.png ./
 	rm -rf usr
@@ -17,11 +17,30 @@
 
 
 import os
-from PIL import Image, ImageTk
+import sys
+import time
+
+## start of the program, startup phases are measured from it
+startup_start = time.perf_counter()
+
 import tkinter as tk
 from tkinter import font as tkFont
 import LibProcExpr as pe
 
+# results (e.g. 50000!) may have more digits than Python converts to a string by default
+if hasattr(sys, "set_int_max_str_digits"):
+    sys.set_int_max_str_digits(0)
+
+## measured startup phases as (name, seconds since startup_start)
+startup_times = [("imports", time.perf_counter() - startup_start)]
+## longest allowed time (in seconds) until the first frame, can be set by environment variable GAPACALC_STARTUP_BUDGET
+startup_budget = float(os.environ.get("GAPACALC_STARTUP_BUDGET", 0.5))
+## print startup report to standard error, enabled by option --startup-time (which also exits after startup)
+## or by environment variable GAPACALC_STARTUP_REPORT=1
+startup_report = "--startup-time" in sys.argv or os.environ.get("GAPACALC_STARTUP_REPORT", "") not in ("", "0")
+## False if the reported first frame exceeded startup_budget
+startup_within = True
+
 
 # colors initialization
 button_color = "#424242"
@@ -46,15 +65,29 @@ button_font = tkFont.Font(family = 'Helvetica', size = 22, weight = 'bold')
 help_font = tkFont.Font(family = 'Helvetica', size = 15)
 help_text_f = tkFont.Font(family = 'Helvetica', size = 15)
 
-# adding logo
-image = Image.open(logo_location)
-image = image.resize((110, 110))
-photo = ImageTk.PhotoImage(image)
-
-logo = tk.Label(root, image = photo, borderwidth = 0)
-logo.image = photo
+# adding logo, the image is loaded by load_logo after the window is shown, an empty image keeps its place
+# the label keeps a reference to the image, otherwise Tk deletes it together with the Python object
+logo_placeholder = tk.PhotoImage(width = 110, height = 110)
+logo = tk.Label(root, image = logo_placeholder, borderwidth = 0)
+logo.image = logo_placeholder
 logo.grid(row = 1, column = 0, rowspan = 2)
 
+##
+# @brief Loads the logo through PIL and displays it.
+# Without PIL the place of the logo stays empty.
+#
+def load_logo():
+    try:
+        from PIL import Image, ImageTk
+    except ImportError:
+        return
+    image = Image.open(logo_location)
+    image = image.resize((110, 110))
+    photo = ImageTk.PhotoImage(image)
+    logo.configure(image = photo)
+    logo.image = photo
+    return
+
 
 # label to display calculator history
 ans_str = tk.StringVar()
@@ -120,6 +153,7 @@ def b_num(new):
 
     ans_displayed = False
     entry.xview_moveto(1)
+    schedule_preview()
     return
 
 ##
@@ -138,41 +172,63 @@ def b_operator(new):
     entry.insert(0, formula)
     ans_displayed = False
     entry.xview_moveto(1)
+    schedule_preview()
     return
 
+## time limit of one calculation in seconds, can be set by environment variable GAPACALC_TIMEOUT
+eval_timeout = float(os.environ.get("GAPACALC_TIMEOUT", 10))
+## how often (in milliseconds) the running calculation is checked
+poll_interval = 20
+## running calculation as a dictionary (process, connection, expression, start time), None when idle
+running = None
+## messages displayed instead of result for the errors of calculation
+error_messages = {
+    ValueError: "Value Error",
+    IndexError: "Value Error",
+    ZeroDivisionError: "Zero division Error",
+    OverflowError: "Overflow Error",
+    TimeoutError: "Timeout Error",
+}
+
+## number of remembered results
+history_size = 100
+## results of previous calculations as text, keyed by pe.result_key, values are (expression, result)
+result_cache = pe.LRUCache(history_size)
+## window with the list of previous results and its listbox, None when closed
+history_window = None
+
 ##
-# @brief Evaluates the content of entry field and replaces it with result.
-# If the input is invalid prints error message into the entry field.
-# Does nothing when entry field is empty.
+# @brief Solves expression in a worker process and sends the result as text (or exception) back.
+# The result is converted to text here, as converting a huge number takes long and
+# it's covered by the time limit and Esc only in the worker.
 #
-# @param event Parameter that is required for keybinds, default value is None.
+# @param conn End of the pipe the result is sent to.
+# @param expr Expression to be solved.
 #
-def b_equal(event=None):
+def solve_worker(conn, expr):
+    result = pe.solve_or_error(expr)
+    conn.send(result if isinstance(result, Exception) else str(result))
+    conn.close()
+
+##
+# @brief Displays result of calculation in the entry field.
+# Exceptions are displayed as error messages.
+#
+# @param expr Solved expression.
+# @param result Result of the expression as text or exception.
+#
+def show_result(expr, result):
     global ans_displayed
     global glob_result
 
-    expr = entry.get()
-    if len(expr) == 0:
-        return
-    err = False
-
-    try:
-        result = pe.solve_expr(expr)
-    except ValueError:
-        err = True
-        result = str("Value Error")
-    except ZeroDivisionError:
-        err = True
-        result = str("Zero division Error")
-    except IndexError:
-        err = True
-        result = str("Value Error")
-
+    err = isinstance(result, Exception)
     if err:
-       entry.configure(validate="none")
+        result = error_messages.get(type(result), "Error")
+        entry.configure(validate="none")
     else:
-         glob_result = result
-
+        glob_result = result
+        result_cache.put(pe.result_key(expr), (expr, result))
+        update_history()
 
     ans_str.set(str(expr) + " = ")
     entry.delete(0, tk.END)
@@ -182,9 +238,133 @@ def b_equal(event=None):
     ans_displayed = True
     return
 
+##
+# @brief Stops the running calculation.
+#
+def stop_calculation():
+    global running
+    if running["process"].is_alive():
+        running["process"].kill()
+    running["process"].join()
+    running["conn"].close()
+    running = None
+    root.configure(cursor="")
+    return
+
+##
+# @brief Checks whether the running calculation finished or exceeded the time limit.
+# Reschedules itself by root.after until the calculation ends, so the window stays responsive.
+#
+def poll_calculation():
+    if running is None:
+        return
+    expr = running["expr"]
+
+    if running["conn"].poll():
+        try:
+            result = running["conn"].recv()
+        except EOFError:
+            result = RuntimeError("calculation failed")
+        stop_calculation()
+        show_result(expr, result)
+    elif not running["process"].is_alive():
+        stop_calculation()
+        show_result(expr, RuntimeError("calculation failed"))
+    elif time.monotonic() - running["start"] > eval_timeout:
+        stop_calculation()
+        show_result(expr, TimeoutError())
+    else:
+        root.after(poll_interval, poll_calculation)
+    return
+
+##
+# @brief Evaluates the content of entry field and replaces it with result.
+# Previously computed expressions are taken from result_cache, others are solved
+# in a worker process and the result is displayed when it's ready.
+# If the input is invalid prints error message into the entry field.
+# Does nothing when entry field is empty or a calculation is already running.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def b_equal(event=None):
+    global running
+
+    expr = entry.get()
+    if len(expr) == 0 or running is not None:
+        return
+
+    # expression computed before
+    cached = result_cache.get(pe.result_key(expr))
+    if cached is not None:
+        show_result(expr, cached[1])
+        return
+
+    import multiprocessing
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context("fork").Process(target=solve_worker, args=(sender, expr), daemon=True)
+    process.start()
+    sender.close()
+    running = {"process": process, "conn": receiver, "expr": expr, "start": time.monotonic()}
+
+    # busy indicator
+    ans_str.set(str(expr) + " = ...")
+    root.configure(cursor="watch")
+    root.after(poll_interval, poll_calculation)
+    return
+
+##
+# @brief Cancels the running calculation, the expression stays in the entry field.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def b_cancel(event=None):
+    if running is None:
+        return
+    expr = running["expr"]
+    stop_calculation()
+    ans_str.set(str(expr) + " = cancelled")
+    return
+
+## delay (in milliseconds) between the last change of the input and computing the preview
+preview_delay = 150
+## preview of the typed expression, remembers already evaluated part of the input
+preview = pe.Preview()
+## scheduled computation of the preview, None when nothing is scheduled
+preview_job = None
+
+##
+# @brief Schedules preview of the result, the previously scheduled one is cancelled.
+# Called after every change of the input, so the preview is computed only when typing pauses.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def schedule_preview(event=None):
+    global preview_job
+    if preview_job is not None:
+        root.after_cancel(preview_job)
+    preview_job = root.after(preview_delay, show_preview)
+    return
+
+##
+# @brief Displays preview of the result of the typed expression in the history label.
+# Nothing is displayed if the expression is unfinished, invalid or too expensive to compute before Enter is pressed.
+#
+def show_preview():
+    global preview_job
+    preview_job = None
+    if running is not None or ans_displayed:
+        return
+    result = preview.update(entry.get())
+    ans_str.set("" if result is None else "= " + str(result))
+    return
+
 # binding corresponding keys to equals button
 root.bind('<Return>', b_equal)
 root.bind('<KP_Enter>', b_equal)
+# binding Esc to cancel running calculation
+root.bind('<Escape>', b_cancel)
+# updating preview after typing
+root.bind('<KeyRelease>', schedule_preview)
 
 ##
 # @brief Deletes last character of the entry.
@@ -200,6 +380,7 @@ def b_delete(event=None):
 
     index = len(entry.get()) - 1
     entry.delete(index, tk.END)
+    schedule_preview()
     return
 
 ##
@@ -216,17 +397,29 @@ def b_clear_empty(event=None):
 # binding corresponding keys to AC button
 root.bind('e',b_clear_empty)
 
+## help window, built when it's opened for the first time and hidden when closed
+help_window = None
+
 ##
 # @brief Opens toplevel window with help.
 # This function is called whenever Help button is pressed
 #
 def show_help():
+    global help_window
+    if help_window is not None:
+        help_window.deiconify()
+        help_window.lift()
+        help_window.focus_set()
+        return
+
     Help = tk.Toplevel(root)
     Help.title("Help")
     Help.configure(bg = button_color)
     Help.geometry("800x650")
     Help.resizable(0,0)
+    Help.protocol("WM_DELETE_WINDOW", Help.withdraw)
     Help.focus_set()
+    help_window = Help
 
     help_text = """
 Equations are entered in standart mathematical form.
@@ -249,19 +442,251 @@ Buttons with special function:
     - MOD\t - inserts modulo operator % into the input field
     - AC\t - deletes the whole input field
     - DEL\t - deletes last character from the input field
+    - History\t - shows previous results, double click inserts result into the input field
+    - Graph\t - draws graph of expression with variable x, drag to move it, wheel to zoom
 
 Keyboard can aslo be used for input, special buttons key equivalents are:
     <button>         <key>
       ANS\t\ta\t (answer)
       AC\t\te\t  (erase)
       DEL\t       <Backspace>
+      History\t\th
+      Graph\t\tg
       MOD\t\t%
       √\t\tr\t (root)
       =\t       <Enter> or <Return>
+
+The result is previewed above the input field while typing,
+large factorials and powers are computed only after pressing <Enter>.
+Long calculations can be cancelled by <Esc>.
     """
     tk.Message(Help, text=help_text,font=help_text_f, fg="#c7c7c7", bg=button_color, justify=tk.LEFT).pack()
     return
 
+##
+# @brief Fills the list of previous results in the history window, the latest result first.
+# Does nothing when the window is closed.
+#
+def update_history():
+    if history_window is None:
+        return
+    listbox = history_window[1]
+    listbox.delete(0, tk.END)
+    for key, (expr, result) in reversed(result_cache.items()):
+        listbox.insert(tk.END, str(expr) + " = " + str(result))
+    return
+
+##
+# @brief Inserts the result selected in the history window into the entry field.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def recall_history(event=None):
+    selection = history_window[1].curselection()
+    if not selection:
+        return
+    entries = result_cache.items()
+    expr, result = entries[len(entries) - 1 - int(selection[0])][1]
+    b_num(result)
+    return
+
+##
+# @brief Forgets the history window when it's closed.
+#
+def close_history():
+    global history_window
+    history_window[0].destroy()
+    history_window = None
+    return
+
+##
+# @brief Opens toplevel window with the list of previous results.
+# Double click or Enter on a result inserts it into the entry field like ANS.
+# This function is called whenever History button is pressed.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def show_history(event=None):
+    global history_window
+    if history_window is not None:
+        history_window[0].lift()
+        return
+
+    window = tk.Toplevel(root)
+    window.title("History")
+    window.configure(bg = button_color)
+    window.protocol("WM_DELETE_WINDOW", close_history)
+    listbox = tk.Listbox(window, width = 40, height = 15, font = help_text_f, fg = "#c7c7c7", bg = button_color, bd = 0, highlightbackground = hbgc, selectmode = tk.SINGLE)
+    listbox.pack(fill = tk.BOTH)
+    listbox.bind('<Double-Button-1>', recall_history)
+    listbox.bind('<Return>', recall_history)
+    history_window = (window, listbox)
+    update_history()
+    return
+
+# binding corresponding keys to History button
+root.bind('h', show_history)
+
+## size of the graph in pixels
+graph_width = 480
+graph_height = 320
+## time (in seconds) one redraw of the graph may spend computing, the rest is drawn in following frames
+graph_budget = 0.016
+## graph window as a dictionary (window, entry, canvas, renderer, expression, job, drag), None when closed
+graph = None
+
+##
+# @brief Validates input of the graph expression, numbers, operators and variable x are allowed.
+#
+# @param action Action that should be performed (insertion | deletion).
+# @param char Character that should be added or deleted.
+#
+# @return True if action is valid otherwise False.
+#
+def graphValidCheck(action, char):
+    if action == '0':
+        return True
+    for i in char:
+        if i not in "0123456789./*-+^%!√x":
+            return False
+    return True
+
+##
+# @brief Draws the graph, the tiles that aren't ready yet are computed in the following frames.
+#
+def redraw_graph():
+    graph["job"] = None
+    canvas = graph["canvas"]
+    renderer = graph["renderer"]
+    canvas.delete("all")
+
+    # axes
+    px, py = renderer.to_pixels(0, 0)
+    canvas.create_line(0, py, graph_width, py, fill = "#707070")
+    canvas.create_line(px, 0, px, graph_height, fill = "#707070")
+    if graph["expression"] is None:
+        return
+
+    lines, complete = renderer.render(graph["expression"], graph_budget)
+    for line in lines:
+        canvas.create_line(*line, fill = "#c7c7c7", width = 2)
+    if not complete:
+        graph["job"] = root.after(1, redraw_graph)
+    return
+
+##
+# @brief Schedules redraw of the graph, several changes before it are drawn at once.
+#
+def schedule_graph():
+    if graph is not None and graph["job"] is None:
+        graph["job"] = root.after(1, redraw_graph)
+    return
+
+##
+# @brief Compiles the expression from the graph entry field and draws it.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def draw_graph(event=None):
+    try:
+        graph["expression"] = pe.VectorExpr(graph["entry"].get())
+        # the expression is evaluated for every tile, constant parts are computed only once
+        graph["expression"].optimize()
+    except ValueError:
+        graph["expression"] = None
+        graph["entry"].configure(validate="none")
+        graph["entry"].delete(0, tk.END)
+        graph["entry"].insert(0, "Value Error")
+        graph["entry"].configure(validate="key")
+    schedule_graph()
+    return
+
+##
+# @brief Moves the graph with the mouse.
+#
+# @param event Mouse event.
+#
+def drag_graph(event):
+    if graph["drag"] is not None:
+        graph["renderer"].pan(event.x - graph["drag"][0], event.y - graph["drag"][1])
+        schedule_graph()
+    graph["drag"] = (event.x, event.y)
+    return
+
+##
+# @brief Ends moving of the graph.
+#
+# @param event Mouse event.
+#
+def release_graph(event):
+    graph["drag"] = None
+    return
+
+##
+# @brief Zooms the graph by mouse wheel around the mouse pointer.
+#
+# @param event Mouse event.
+#
+def zoom_graph(event):
+    zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+    graph["renderer"].zoom(1.25 if zoom_in else 0.8, event.x, event.y)
+    schedule_graph()
+    return
+
+##
+# @brief Forgets the graph window when it's closed.
+#
+def close_graph():
+    global graph
+    if graph["job"] is not None:
+        root.after_cancel(graph["job"])
+    graph["window"].destroy()
+    graph = None
+    return
+
+##
+# @brief Opens toplevel window for drawing graphs of expressions with variable x.
+# This function is called whenever Graph button is pressed.
+#
+# @param event Parameter that is required for keybinds, default value is None.
+#
+def show_graph(event=None):
+    global graph
+    if graph is not None:
+        graph["window"].lift()
+        return
+    try:
+        import LibGraph
+    except ImportError:
+        ans_str.set("Graph needs NumPy")
+        return
+
+    window = tk.Toplevel(root)
+    window.title("Graph")
+    window.configure(bg = hbgc)
+    window.resizable(0, 0)
+    window.protocol("WM_DELETE_WINDOW", close_graph)
+    tk.Label(window, text = "y =", font = help_font, fg = "#c7c7c7", bg = hbgc).grid(row = 0, column = 0)
+    graph_entry = tk.Entry(window, validate = 'key', validatecommand = (window.register(graphValidCheck), '%d', '%S'), width = 30, bg = "#404040", bd = 0, highlightbackground = hbgc, font = ('Helvetica', 20))
+    graph_entry.grid(row = 0, column = 1, sticky = tk.W)
+    graph_entry.bind('<Return>', draw_graph)
+    graph_entry.focus_set()
+    canvas = tk.Canvas(window, width = graph_width, height = graph_height, bg = "#404040", highlightbackground = hbgc)
+    canvas.grid(row = 1, column = 0, columnspan = 2)
+    canvas.bind('<B1-Motion>', drag_graph)
+    canvas.bind('<ButtonRelease-1>', release_graph)
+    canvas.bind('<MouseWheel>', zoom_graph)
+    canvas.bind('<Button-4>', zoom_graph)
+    canvas.bind('<Button-5>', zoom_graph)
+
+    graph = {"window": window, "entry": graph_entry, "canvas": canvas, "expression": None, "job": None, "drag": None,
+             "renderer": LibGraph.GraphRenderer(graph_width, graph_height)}
+    schedule_graph()
+    return
+
+# binding corresponding keys to Graph button
+root.bind('g', show_graph)
+
 ##
 # @brief Auxiliary function for ANS key binding.
 # Calls function that inserts answer into entry field.
@@ -290,6 +715,8 @@ root.bind('r',keyb_root)
 
 # creating help button in the top bar
 button_help = tk.Button(root, text = "Help", font = help_font, bd = 0, activebackground = active_color, highlightbackground = hbgc, bg = hbgc, padx = padx_size, pady = pady_size, height = 1, width = 2,  command = lambda: show_help())
+button_history = tk.Button(root, text = "History", font = help_font, bd = 0, activebackground = active_color, highlightbackground = hbgc, bg = hbgc, padx = padx_size, pady = pady_size, height = 1, width = 4,  command = lambda: show_history())
+button_graph = tk.Button(root, text = "Graph", font = help_font, bd = 0, activebackground = active_color, highlightbackground = hbgc, bg = hbgc, padx = padx_size, pady = pady_size, height = 1, width = 4,  command = lambda: show_graph())
 
 # number buttons
 button_1 = tk.Button(root, text = "1", font = button_font, activebackground = active_color, bd = 0, highlightbackground = hbgc, bg = button_color, padx = padx_size, pady = pady_size, height = 2, width = 5, command = lambda: b_num(1))
@@ -320,6 +747,8 @@ button_fact = tk.Button(root, text = "!", font = button_font, activebackground =
 
 # griding elements to the root window
 button_help.grid(row = 0, column = 0, sticky = tk.W)
+button_history.grid(row = 0, column = 1, sticky = tk.W)
+button_graph.grid(row = 0, column = 2, sticky = tk.W)
 
 history.grid(row = 1, column = 1, columnspan = 5, sticky = tk.S)
 
@@ -354,8 +783,50 @@ button_0.grid(row = 8, column = 0, columnspan = 2)
 button_point.grid(row = 8, column = 2)
 button_equal.grid(row = 8, column = 3)
 
+##
+# @brief Records the first frame of the window and schedules loading of the deferred parts.
+#
+def first_frame():
+    root.update_idletasks()
+    startup_times.append(("first frame", time.perf_counter() - startup_start))
+    root.after(1, load_deferred)
+    return
+
+##
+# @brief Loads the parts deferred until the window is shown and reports startup times if requested.
+#
+def load_deferred():
+    load_logo()
+    startup_times.append(("logo", time.perf_counter() - startup_start))
+    if startup_report:
+        global startup_within
+        startup_within = report_startup(sys.stderr)
+        if "--startup-time" in sys.argv:
+            root.destroy()
+    return
+
+##
+# @brief Writes measured startup phases.
+#
+# @param out Stream the report is written to.
+#
+# @return True if the first frame was shown within startup_budget.
+#
+def report_startup(out):
+    for name, elapsed in startup_times:
+        out.write("%-14s %8.1f ms\n" % (name, elapsed * 1000))
+    shown = dict(startup_times)["first frame"]
+    within = shown <= startup_budget
+    out.write("first frame %s budget of %.1f ms\n" % ("within" if within else "OVER", startup_budget * 1000))
+    return within
+
+startup_times.append(("window built", time.perf_counter() - startup_start))
+root.after(0, first_frame)
 root.mainloop()
 
+if not startup_within:
+    sys.exit(1)
+
 
 
 
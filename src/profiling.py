@@ -1,25 +1,457 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: profiling.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: Standard deviation of numbers from standard input
+###################################################################
+
+##
+# @file profiling.py
+#
+# @brief Computes standard deviation of whitespace separated numbers from standard input
+# Run in directory src:
+# $ echo "10 20 30 40 50" | python3 profiling.py
+# $ python3 profiling.py --stream < big_input.txt
+# $ python3 profiling.py --file big_input.txt --workers 4
+# $ python3 profiling.py --convert big_input.npy < big_input.txt
+# $ python3 profiling.py --binary big_input.npy
+#
+# With --stream the input is read in chunks and statistics are updated as the numbers come,
+# so memory doesn't grow with the size of the input. With --file the file is memory mapped
+# and its parts are processed in parallel. --convert stores the numbers as doubles (raw or .npy),
+# which --binary memory maps again without any parsing.
+#
+
 from LibMath import *
+import LibMath
+import argparse
+import ast
+import mmap
+import os
+import re
+import struct
 import sys
+import warnings
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+    # NumPy older than 1.18 stops at malformed text without any notice, so its parse can't be trusted
+    numpy_parse = tuple(int(part) for part in np.__version__.split(".")[:2]) >= (1, 18)
+except ImportError:
+    np = None
+    numpy_parse = False
 
 
 def mean(data):
+    if np is not None and isinstance(data, np.ndarray):
+        return float(div(float(data.sum()), len(data)))
     return float(div(sum(data), len(data)))
 
 def variance(data):
     mu = mean(data)
+    if np is not None and isinstance(data, np.ndarray):
+        return mean(LibMath.vec.power(LibMath.vec.sub(data, mu), 2))
     return mean([power((sub(x, mu)), 2) for x in data])
 
 def stddev(data):
     return root(variance(data), 2)
 
-numbers = sys.stdin.read()
+## number of bytes read from the input at once in streaming mode
+chunk_size = 1 << 16
+
+## regular expression matching one item of the input
+item_re = re.compile(rb"\S+")
+
+##
+# @brief Error raised when input contains items that aren't numbers
+# Attribute bad is a list of (offset, item) pairs of all such items.
+#
+class IngestError(ValueError):
+    def __init__(self, bad):
+        self.bad = bad
+        offset, item = bad[0]
+        super().__init__("Input error - %d item(s) aren't numbers, first is %r at offset %d"
+                         % (len(bad), item.decode(errors="replace"), offset))
+
+    # keeps the list of items when the error is passed from a worker process
+    def __reduce__(self):
+        return IngestError, (self.bad,)
+
+##
+# @brief Finds items of the input that aren't numbers
+#
+# @param data Input as bytes
+# @param offset Offset of data in the whole input, added to offsets of the items
+#
+# @return List of (offset, item) pairs
+def find_bad_items(data, offset=0):
+    bad = list()
+    for match in item_re.finditer(data):
+        try:
+            float(match.group())
+        except ValueError:
+            bad.append((offset + match.start(), match.group()))
+    return bad
+
+##
+# @brief Counts whitespace separated items of the input without splitting it
+#
+# @param data Input as bytes
+#
+# @return Number of items
+def count_items(data):
+    chars = np.frombuffer(data, dtype=np.uint8)
+    space = (chars == 32) | ((chars >= 9) & (chars <= 13))
+    return int(np.count_nonzero(~space[1:] & space[:-1])) + (1 if chars.size and not space[0] else 0)
+
+##
+# @brief Converts whitespace separated numbers into a contiguous array of doubles
+# NumPy array is returned when NumPy is available, array('d') otherwise.
+# NumPy parses the whole buffer at once. If it fails, warns about unparsed data or reads a different
+# number of items (its number format differs from float in rare cases), the input is parsed item by item.
+#
+# @param data Input as bytes (or str)
+# @param use_numpy Whether to use NumPy, by default it's used when available
+#
+# @exception IngestError if input contains items that aren't numbers
+#
+# @return Array of numbers
+def parse_numbers(data, use_numpy=None):
+    if isinstance(data, str):
+        data = data.encode()
+    if use_numpy is None:
+        use_numpy = np is not None
+
+    if use_numpy and numpy_parse:
+        try:
+            with warnings.catch_warnings():
+                # NumPy older than 2.0 warns about unparsed data instead of raising
+                warnings.simplefilter("error", DeprecationWarning)
+                numbers = np.fromstring(data, sep=" ")
+            if numbers.size == count_items(data):
+                return numbers
+        except (ValueError, DeprecationWarning):
+            pass
+    try:
+        numbers = array("d", map(float, data.split()))
+    except ValueError:
+        raise IngestError(find_bad_items(data)) from None
+    return np.frombuffer(numbers, dtype=np.float64) if use_numpy else numbers
+
+##
+# @brief Running count, mean and sum of squared deviations (M2) of numbers
+# Numbers are added one by one by Welford's online algorithm, or in batches,
+# which are merged using the formula for combining variances of two parts.
+#
+class RunningStats:
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def __repr__(self):
+        return "RunningStats(count=%r, mean=%r, m2=%r)" % (self.count, self.mean, self.m2)
+
+    ##
+    # @brief Adds one number
+    #
+    # @param x Added number
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    ##
+    # @brief Adds list (or array) of numbers
+    #
+    # @param values List of numbers
+    def add_many(self, values):
+        count = len(values)
+        if count == 0:
+            return
+        batch_mean = sum(values) / count
+        batch_m2 = sum((x - batch_mean) * (x - batch_mean) for x in values)
+        self.merge(RunningStats(count, batch_mean, batch_m2))
+
+    ##
+    # @brief Adds all numbers counted by other statistics
+    #
+    # @param other RunningStats object
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    ##
+    # @brief Variance of the added numbers
+    #
+    # @exception ZeroDivisionError if no numbers were added
+    #
+    # @return Variance (population)
+    def variance(self):
+        return div(self.m2, self.count)
+
+    ##
+    # @brief Standard deviation of the added numbers
+    #
+    # @exception ZeroDivisionError if no numbers were added
+    #
+    # @return Standard deviation (population)
+    def stddev(self):
+        return root(self.variance(), 2)
+
+##
+# @brief Reads whitespace separated numbers from binary stream in chunks
+# Numbers split between two chunks are joined back.
+#
+# @param stream Binary stream (e.g. sys.stdin.buffer) or mmap object
+# @param size Number of bytes read at once
+# @param limit Maximal number of bytes read from the stream, everything by default
+# @param offset Offset of the first read byte in the input, used in IngestError
+#
+# @exception IngestError if a chunk contains items that aren't numbers (all of them are listed)
+#
+# @return Generator of arrays of numbers, one array per chunk
+def read_chunks(stream, size=chunk_size, limit=None, offset=0):
+    rest = b""
+    while True:
+        if limit is not None:
+            if limit <= 0:
+                break
+            chunk = stream.read(min(size, limit))
+            limit -= len(chunk)
+        else:
+            chunk = stream.read(size)
+        if not chunk:
+            break
+        data = rest + chunk
+        items = data.split()
+        rest = b"" if chunk[-1:].isspace() else items.pop()
+        try:
+            values = array("d", map(float, items))
+        except ValueError:
+            raise IngestError(find_bad_items(data[:len(data) - len(rest)], offset)) from None
+        offset += len(data) - len(rest)
+        yield values
+    if rest:
+        try:
+            yield array("d", [float(rest)])
+        except ValueError:
+            raise IngestError([(offset, rest)]) from None
+
+##
+# @brief Computes statistics of numbers from binary stream in constant memory
+#
+# @param stream Binary stream (e.g. sys.stdin.buffer)
+# @param size Number of bytes read at once
+#
+# @return RunningStats object
+def stream_stats(stream, size=chunk_size):
+    stats = RunningStats()
+    for values in read_chunks(stream, size):
+        stats.add_many(values)
+    return stats
+
+##
+# @brief Computes standard deviation of numbers from binary stream in constant memory
+#
+# @param stream Binary stream (e.g. sys.stdin.buffer)
+#
+# @return Standard deviation of the numbers
+def stream_stddev(stream):
+    return stream_stats(stream).stddev()
+
+##
+# @brief Splits memory mapped file into parts ending at whitespace
+#
+# @param mapped mmap object of the file
+# @param parts Number of parts
+#
+# @return List of (start, end) pairs of byte offsets, empty parts are left out
+def split_ranges(mapped, parts):
+    size = len(mapped)
+    bounds = [0]
+    for i in range(1, parts):
+        pos = max(size * i // parts, bounds[-1])
+        while pos < size and not mapped[pos:pos + 1].isspace():
+            pos += 1
+        bounds.append(pos)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+##
+# @brief Computes statistics of numbers from a part of file
+#
+# @param path Path to the file
+# @param start Offset of the first byte of the part
+# @param end Offset after the last byte of the part
+#
+# @return RunningStats object
+def range_stats(path, start, end):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        mapped.seek(start)
+        stats = RunningStats()
+        for values in read_chunks(mapped, limit=end - start, offset=start):
+            stats.add_many(values)
+        return stats
+
+##
+# @brief Computes statistics of numbers from a file using several processes
+# The file is memory mapped and split at whitespace into one part per worker,
+# statistics of the parts are merged together.
+#
+# @param path Path to the file with whitespace separated numbers
+# @param workers Number of worker processes, defaults to the number of CPUs
+#
+# @exception IngestError if file contains items that aren't numbers
+#
+# @return RunningStats object
+def file_stats(path, workers=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return RunningStats()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < workers * chunk_size:
+                workers = 1
+            ranges = split_ranges(mapped, workers)
+
+    stats = RunningStats()
+    if workers == 1:
+        parts = [range_stats(path, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(range_stats, [path] * len(ranges), *zip(*ranges)))
+    for part in parts:
+        stats.merge(part)
+    return stats
+
+## header of .npy files written by convert_to_binary is padded to this size
+npy_header_size = 128
+
+##
+# @brief Creates header of .npy file with one-dimensional array of little-endian doubles
+#
+# @param count Number of items of the array
+#
+# @return Header as bytes, npy_header_size long
+def npy_header(count):
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d,), }" % count
+    header = header.ljust(npy_header_size - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+##
+# @brief Reads header of .npy file and checks it contains one-dimensional array of doubles
+#
+# @param mapped mmap object (or bytes) of the file
+#
+# @exception ValueError if the file isn't .npy file with array of doubles
+#
+# @return Offset of the data and number of items
+def read_npy_header(mapped):
+    if mapped[:6] != b"\x93NUMPY":
+        raise ValueError("Input error - not a .npy file")
+    if mapped[6] == 1:
+        length, = struct.unpack("<H", mapped[8:10])
+        offset = 10
+    else:
+        length, = struct.unpack("<I", mapped[8:12])
+        offset = 12
+    header = ast.literal_eval(bytes(mapped[offset:offset + length]).decode("latin1"))
+    if header["descr"] != "<f8" or header["fortran_order"] or len(header["shape"]) != 1:
+        raise ValueError("Input error - .npy file has to contain one-dimensional array of doubles")
+    return offset + length, header["shape"][0]
+
+##
+# @brief Converts whitespace separated numbers from binary stream into binary file
+# Input is read in chunks. Raw format contains only little-endian doubles,
+# .npy format adds NumPy header. Neither needs NumPy to be written.
+#
+# @param stream Binary stream with text input (e.g. sys.stdin.buffer)
+# @param path Path to the created file, file ending with .npy gets NumPy header
+#
+# @exception IngestError if input contains items that aren't numbers
+#
+# @return Number of converted numbers
+def convert_to_binary(stream, path):
+    npy = path.endswith(".npy")
+    count = 0
+    with open(path, "wb") as file:
+        if npy:
+            file.write(bytes(npy_header_size))
+        for values in read_chunks(stream):
+            if sys.byteorder != "little":
+                values.byteswap()
+            values.tofile(file)
+            count += len(values)
+        if npy:
+            file.seek(0)
+            file.write(npy_header(count))
+    return count
+
+##
+# @brief Memory maps binary file with doubles without copying it
+# With NumPy the result is read-only numpy array, otherwise memoryview of doubles
+# (which requires little-endian machine).
+#
+# @param path Path to raw file or .npy file (recognised by the extension)
+#
+# @exception ValueError if the file isn't valid
+#
+# @return Array of numbers
+def load_binary(path):
+    if np is not None:
+        if path.endswith(".npy"):
+            return np.load(path, mmap_mode="r")
+        return np.memmap(path, dtype="<f8", mode="r") if os.path.getsize(path) else np.empty(0)
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return memoryview(array("d"))
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    offset, count = read_npy_header(mapped) if path.endswith(".npy") else (0, len(mapped) // 8)
+    return memoryview(mapped)[offset:offset + count * 8].cast("d")
 
-data = numbers.split()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Standard deviation of numbers from standard input.")
+    parser.add_argument("--stream", action="store_true", help="read input in chunks, in constant memory")
+    parser.add_argument("--file", help="read numbers from file instead, using several processes")
+    parser.add_argument("--workers", type=int, help="number of processes for --file (default: number of CPUs)")
+    parser.add_argument("--binary", help="read doubles from raw or .npy file instead")
+    parser.add_argument("--convert", metavar="OUTPUT",
+                        help="convert standard input into raw (or .npy, by extension) file and exit")
+    args = parser.parse_args(argv)
 
-for i in range(len(data)):
-    data[i] = float(data[i])
+    try:
+        if args.convert is not None:
+            convert_to_binary(sys.stdin.buffer, args.convert)
+            return
+        if args.binary is not None:
+            x = stddev(load_binary(args.binary))
+        elif args.file is not None:
+            x = file_stats(args.file, args.workers).stddev()
+        elif args.stream:
+            x = stream_stddev(sys.stdin.buffer)
+        else:
+            x = stddev(parse_numbers(sys.stdin.buffer.read()))
+    except IngestError as error:
+        for offset, item in error.bad[:10]:
+            sys.stderr.write("offset %d: %r isn't a number\n" % (offset, item.decode(errors="replace")))
+        sys.exit(1)
 
-x = stddev(data)
+    print(x)
 
-print(x)
+if __name__ == "__main__":
+    main()
 
+# End of file profiling.py
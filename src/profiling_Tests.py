@@ -0,0 +1,204 @@
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: profiling_Tests.py
+# Authors: Pavel Marek
+# Description: Test for profiling.py
+###################################################################
+# Run the tests in directory src:
+# $ python3 profiling_Tests.py
+#
+
+import io
+import os
+import random
+import tempfile
+import unittest
+import profiling
+
+
+# Tests of bulk conversion of the input
+class TestParseNumbers(unittest.TestCase):
+
+    def test_parse_numbers_array(self):
+        data = profiling.parse_numbers(b" 1 2.5\n-3e2\t4 ", use_numpy=False)
+        self.assertEqual(data.typecode, "d")
+        self.assertEqual(list(data), [1, 2.5, -300, 4])
+
+    @unittest.skipIf(profiling.np is None, "NumPy is not installed")
+    def test_parse_numbers_numpy(self):
+        data = profiling.parse_numbers("1 2.5 -3e2 4", use_numpy=True)
+        self.assertEqual(data.dtype, profiling.np.float64)
+        self.assertEqual(list(data), [1, 2.5, -300, 4])
+        self.assertAlmostEqual(profiling.stddev(data), profiling.stddev(list(data)))
+        # formats NumPy doesn't read are parsed item by item, as by float
+        self.assertEqual(list(profiling.parse_numbers(b"1_0\n 2 ", use_numpy=True)), [10, 2])
+        self.assertEqual(profiling.count_items(b" 1 2.5\n-3e2\t4 "), 4)
+
+    def test_parse_numbers_bad_items(self):
+        for use_numpy in [False, profiling.np is not None]:
+            with self.assertRaises(profiling.IngestError) as context:
+                profiling.parse_numbers(b"1 2 x 4 1.2.3", use_numpy=use_numpy)
+            self.assertEqual(context.exception.bad, [(4, b"x"), (8, b"1.2.3")])
+            with self.assertRaises(profiling.IngestError) as context:
+                profiling.parse_numbers(b"1 2 3x", use_numpy=use_numpy)
+            self.assertEqual(context.exception.bad, [(4, b"3x")])
+
+    @unittest.skipIf(profiling.np is None, "NumPy is not installed")
+    def test_parse_numbers_without_numpy_parse(self):
+        numpy_parse = profiling.numpy_parse
+        profiling.numpy_parse = False
+        try:
+            data = profiling.parse_numbers(b"1 2.5 -3e2 4", use_numpy=True)
+            self.assertEqual(data.dtype, profiling.np.float64)
+            self.assertEqual(list(data), [1, 2.5, -300, 4])
+            with self.assertRaises(profiling.IngestError):
+                profiling.parse_numbers(b"1 2 3x", use_numpy=True)
+        finally:
+            profiling.numpy_parse = numpy_parse
+
+    def test_stddev_of_array(self):
+        data = profiling.parse_numbers(b"10 20 30 40 50", use_numpy=False)
+        self.assertEqual(profiling.stddev(data), profiling.stddev([10, 20, 30, 40, 50]))
+
+
+# Tests of streaming statistics
+class TestStreamStats(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(42)
+        self.data = [generator.uniform(-1000, 1000) for i in range(5000)]
+        self.text = " ".join(repr(x) for x in self.data).encode()
+
+    def test_running_stats_add(self):
+        stats = profiling.RunningStats()
+        for x in [10, 20, 30, 40, 50]:
+            stats.add(x)
+        self.assertEqual(stats.count, 5)
+        self.assertEqual(stats.mean, 30)
+        self.assertAlmostEqual(stats.stddev(), profiling.stddev([10, 20, 30, 40, 50]))
+
+    def test_running_stats_merge(self):
+        left = profiling.RunningStats()
+        left.add_many(self.data[:1234])
+        right = profiling.RunningStats()
+        right.add_many(self.data[1234:])
+        left.merge(right)
+        self.assertEqual(left.count, len(self.data))
+        self.assertAlmostEqual(left.stddev(), profiling.stddev(self.data), 6)
+
+    def test_read_chunks_joins_split_numbers(self):
+        chunks = list(profiling.read_chunks(io.BytesIO(b"12.5 3\n-7  1e3 42"), size=3))
+        self.assertEqual([x for chunk in chunks for x in chunk], [12.5, 3, -7, 1000, 42])
+
+    def test_stream_stddev(self):
+        self.assertAlmostEqual(profiling.stream_stddev(io.BytesIO(self.text)), profiling.stddev(self.data), 6)
+        stats = profiling.stream_stats(io.BytesIO(self.text), size=7)
+        self.assertAlmostEqual(stats.stddev(), profiling.stddev(self.data), 6)
+
+    def test_stream_bad_items(self):
+        for size in [3, 7, 1 << 16]:
+            with self.subTest(size=size):
+                with self.assertRaises(profiling.IngestError) as context:
+                    profiling.stream_stats(io.BytesIO(b"12.5 3\n-7  1x3 42 abc"), size=size)
+                self.assertEqual(context.exception.bad[0], (11, b"1x3"))
+        with self.assertRaises(profiling.IngestError) as context:
+            profiling.stream_stats(io.BytesIO(b"1 2 3x"), size=4)
+        self.assertEqual(context.exception.bad, [(4, b"3x")])
+
+    def test_stream_empty(self):
+        with self.assertRaises(ZeroDivisionError):
+            profiling.stream_stddev(io.BytesIO(b"  \n"))
+
+
+# Tests of parallel statistics of files
+class TestFileStats(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(7)
+        self.data = [generator.uniform(-50, 50) for i in range(20000)]
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, "w") as file:
+            file.write("\n".join(repr(x) for x in self.data))
+        self.chunk_size = profiling.chunk_size
+        profiling.chunk_size = 1024
+
+    def tearDown(self):
+        profiling.chunk_size = self.chunk_size
+        os.remove(self.path)
+
+    def test_split_ranges_at_whitespace(self):
+        mapped = b"1 22 333 4444 55555"
+        ranges = profiling.split_ranges(mapped, 4)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(mapped))
+        for start, end in ranges:
+            self.assertTrue(end == len(mapped) or mapped[end:end + 1].isspace())
+
+    def test_file_stats_parallel(self):
+        stats = profiling.file_stats(self.path, workers=3)
+        self.assertEqual(stats.count, len(self.data))
+        self.assertAlmostEqual(stats.stddev(), profiling.stddev(self.data), 6)
+
+    def test_file_stats_single_process(self):
+        stats = profiling.file_stats(self.path, workers=1)
+        self.assertAlmostEqual(stats.stddev(), profiling.stddev(self.data), 6)
+
+    def test_file_stats_bad_items(self):
+        with open(self.path, "ab") as file:
+            offset = file.tell() + 1
+            file.write(b" 1.2.3 5")
+        for workers in [1, 3]:
+            with self.subTest(workers=workers):
+                with self.assertRaises(profiling.IngestError) as context:
+                    profiling.file_stats(self.path, workers=workers)
+                self.assertEqual(context.exception.bad, [(offset, b"1.2.3")])
+
+    def test_file_stats_empty(self):
+        with open(self.path, "w"):
+            pass
+        self.assertEqual(profiling.file_stats(self.path).count, 0)
+
+# Tests of binary input format
+class TestBinaryFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [1.5, -2, 3e10, 0.125, 42]
+        self.text = b" ".join(repr(x).encode() for x in self.data)
+        self.dir = tempfile.TemporaryDirectory()
+        self.numpy = profiling.np
+
+    def tearDown(self):
+        profiling.np = self.numpy
+        self.dir.cleanup()
+
+    def convert_and_load(self, name, use_numpy):
+        path = os.path.join(self.dir.name, name)
+        self.assertEqual(profiling.convert_to_binary(io.BytesIO(self.text), path), len(self.data))
+        if not use_numpy:
+            profiling.np = None
+        return profiling.load_binary(path)
+
+    def test_raw_format(self):
+        self.assertEqual(list(self.convert_and_load("data.raw", False)), self.data)
+
+    def test_npy_format(self):
+        self.assertEqual(list(self.convert_and_load("data.npy", False)), self.data)
+
+    @unittest.skipIf(profiling.np is None, "NumPy is not installed")
+    def test_npy_format_numpy(self):
+        data = self.convert_and_load("data.npy", True)
+        self.assertEqual(list(data), self.data)
+        self.assertEqual(list(profiling.np.load(os.path.join(self.dir.name, "data.npy"))), self.data)
+        self.assertEqual(profiling.stddev(data), profiling.stddev(self.data))
+
+    def test_not_npy_file(self):
+        path = os.path.join(self.dir.name, "bad.npy")
+        with open(path, "wb") as file:
+            file.write(b"1 2 3 4 5 6 7 8 9")
+        profiling.np = None
+        with self.assertRaises(ValueError):
+            profiling.load_binary(path)
+
+# to simplify testing
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: server.py
+# Authors: Vilem Gottwald, Pavel Marek
+# Description: Local HTTP/JSON service solving expressions
+###################################################################
+
+##
+# @file server.py
+#
+# @brief Local HTTP/JSON service solving expressions with LibProcExpr
+# Run in directory src:
+# $ python3 server.py --port 8080 --workers 4
+# $ curl -d '{"expr": "2+3*4"}' http://127.0.0.1:8080/solve
+# $ curl -d '{"exprs": ["1/3", "1/0"]}' http://127.0.0.1:8080/solve
+# $ curl http://127.0.0.1:8080/metrics
+# $ python3 server.py --unix /tmp/gapacalc.sock
+#
+# POST /solve answers {"result": ...} or {"error": kind, "message": ...} for "expr", or a list of these
+# for "exprs", in the same format as cli.py --format json. GET /metrics returns counts of requests,
+# errors and timeouts, throughput and latency percentiles (in milliseconds).
+#
+# Connections are kept alive (HTTP/1.1). Expressions arriving at about the same time are collected
+# into one batch (for at most batch_delay seconds or max_batch expressions), which is split among
+# the worker processes, one call per worker. Every expression has a time limit counted from the start
+# of its computation, when it's exceeded the expression is answered by TimeoutError and the worker
+# is interrupted, so a slow expression doesn't use up the time of the others.
+#
+# Worker processes are started by a fork server, so they don't inherit sockets of the connections
+# (a connection closed by the service would stay open in the workers).
+#
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from functools import partial
+import LibMath
+import LibProcExpr
+import cli
+
+## longest time (in seconds) an expression waits for others to form a batch
+batch_delay = 0.002
+## largest number of expressions solved in one batch
+max_batch = 256
+## largest accepted body of a request in bytes
+max_body = 1 << 20
+
+## HTTP reasons of the used status codes
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+##
+# @brief Handler of SIGALRM in worker processes, interrupts the running expression
+def alarm_handler(signum, frame):
+    raise TimeoutError("Time limit exceeded")
+
+##
+# @brief Initializer of worker processes
+def init_worker():
+    signal.signal(signal.SIGALRM, alarm_handler)
+    # results may have any number of digits
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+
+##
+# @brief Creates pool of worker processes
+#
+# @param workers Number of worker processes
+#
+# @return ProcessPoolExecutor
+def make_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"),
+                               initializer=init_worker)
+
+##
+# @brief Solves batch of expressions in a worker process
+# Results are converted to JSON fields here, within the time limit, as converting a huge number
+# to a string can take longer than computing it and would block the service. Expressions are solved
+# without LibProcExpr.expr_cache, so a long running worker doesn't keep every request it has seen.
+#
+# @param exprs List of expressions
+# @param time_limit Time limit of every expression in seconds, counted from the start of its computation
+# @param context LibMath.Context the expressions are solved in
+#
+# @return List of JSON fields of the results, see cli.result_fields
+def solve_batch(exprs, time_limit, context):
+    results = list()
+    for expr in exprs:
+        try:
+            signal.setitimer(signal.ITIMER_REAL, time_limit)
+            try:
+                fields = cli.result_fields(LibProcExpr.solve_or_error(expr, context=context, cache=False))
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except TimeoutError as error:
+            fields = cli.result_fields(error)
+        results.append(fields)
+    return results
+
+##
+# @brief Latency and throughput statistics of the service
+#
+class ServiceMetrics:
+    ##
+    # @brief Constructor
+    #
+    # @param window Number of the latest requests latency percentiles are computed from
+    def __init__(self, window=10000):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.expressions = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=window)
+
+    ##
+    # @brief Records one solved expression
+    #
+    # @param latency Time from receiving the expression to having its result, in seconds
+    # @param fields JSON fields of the result, see cli.result_fields
+    def record(self, latency, fields):
+        self.expressions += 1
+        self.latencies.append(latency)
+        if fields.get("error") == "TimeoutError":
+            self.timeouts += 1
+        elif "error" in fields:
+            self.errors += 1
+
+    ##
+    # @brief Returns the statistics
+    #
+    # @return Dictionary, see the file description
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "uptime": uptime,
+            "requests": self.requests,
+            "expressions": self.expressions,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "batches": self.batches,
+            "mean_batch_size": self.expressions / self.batches if self.batches else 0.0,
+            "throughput": self.expressions / uptime if uptime > 0 else 0.0,
+            "latency_ms": {
+                "mean": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+                "max": latencies[-1] * 1000 if latencies else 0.0,
+            },
+        }
+
+##
+# @brief HTTP/JSON service solving expressions, see the file description
+#
+class CalcServer:
+    ##
+    # @brief Constructor, the service is started by start
+    #
+    # @param workers Number of worker processes
+    # @param time_limit Time limit of one expression in seconds
+    # @param context LibMath.Context the expressions are solved in, the current context by default
+    def __init__(self, workers=1, time_limit=5.0, context=None):
+        self.workers = workers
+        self.time_limit = time_limit
+        self.context = context if context is not None else LibMath.getcontext()
+        self.metrics = ServiceMetrics()
+        self.pool = None
+        self.server = None
+        self.pending = list()
+        self.flush_handle = None
+        self.connections = dict()
+
+    ##
+    # @brief Starts listening on TCP port or Unix socket
+    #
+    # @param host Address to listen on
+    # @param port TCP port, 0 for any free port
+    # @param path Path of Unix socket, used instead of host and port if given
+    #
+    # @return Listening address, (host, port) or path
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        self.pool = make_pool(self.workers)
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+            return path
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    ##
+    # @brief Stops listening, closes connections and shuts the worker processes down
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            # open connections are closed as well, their handlers finish on end of input
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    ##
+    # @brief Solves expression as a part of the next batch
+    #
+    # @param expr Expression
+    #
+    # @return JSON fields of the result, see cli.result_fields
+    async def solve(self, expr):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        future = loop.create_future()
+        self.pending.append((expr, future))
+        if len(self.pending) >= max_batch:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(batch_delay, self.flush)
+
+        result = await future
+        self.metrics.record(time.monotonic() - start, result)
+        return result
+
+    ##
+    # @brief Splits the collected expressions among the worker processes, every part is sent as one call
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, list()
+        if not batch:
+            return
+        self.metrics.batches += 1
+        loop = asyncio.get_running_loop()
+        parts = min(self.workers, len(batch))
+        for i in range(parts):
+            part = batch[i::parts]
+            exprs = [expr for expr, future in part]
+            try:
+                solved = self.submit(exprs)
+            except BrokenProcessPool as error:
+                for expr, future in part:
+                    if not future.done():
+                        future.set_result(cli.result_fields(error))
+                continue
+            # the worker interrupts every expression itself, this only guards against a stuck worker
+            guard = loop.call_later(len(part) * self.time_limit + 1, self.expire, part)
+            solved.add_done_callback(partial(self.deliver, part, guard, self.pool))
+
+    ##
+    # @brief Shuts the broken pool of worker processes down and starts a new one
+    def replace_pool(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = make_pool(self.workers)
+
+    ##
+    # @brief Sends expressions to the worker processes
+    # If the pool broke while it was idle (e.g. a worker was killed), the expressions are sent to a new pool.
+    #
+    # @param exprs List of expressions
+    #
+    # @exception BrokenProcessPool if the new pool is broken as well
+    #
+    # @return asyncio.Future with list of JSON fields of the results
+    def submit(self, exprs):
+        loop = asyncio.get_running_loop()
+        try:
+            return loop.run_in_executor(self.pool, solve_batch, exprs, self.time_limit, self.context)
+        except BrokenProcessPool:
+            self.replace_pool()
+            return loop.run_in_executor(self.pool, solve_batch, exprs, self.time_limit, self.context)
+
+    ##
+    # @brief Answers expressions of a part of batch whose worker didn't finish in time by TimeoutError
+    #
+    # @param part List of (expression, future)
+    def expire(self, part):
+        for expr, future in part:
+            if not future.done():
+                future.set_result(cli.result_fields(TimeoutError("Time limit exceeded")))
+
+    ##
+    # @brief Passes results of a part of batch to the waiting requests
+    #
+    # @param part List of (expression, future)
+    # @param guard Handle of the call of expire, cancelled here
+    # @param pool Pool of worker processes the part was sent to
+    # @param task Finished future with list of JSON fields of the results
+    def deliver(self, part, guard, pool, task):
+        guard.cancel()
+        if task.cancelled():
+            results = [cli.result_fields(RuntimeError("Calculation cancelled"))] * len(part)
+        elif task.exception() is not None:
+            results = [cli.result_fields(task.exception())] * len(part)
+            if isinstance(task.exception(), BrokenProcessPool) and pool is self.pool:
+                # a worker died, following batches get a new pool
+                self.replace_pool()
+        else:
+            results = task.result()
+        for (expr, future), result in zip(part, results):
+            if not future.done():
+                future.set_result(result)
+
+    ##
+    # @brief Answers one request
+    #
+    # @param method HTTP method
+    # @param target Requested path
+    # @param body Body of the request
+    #
+    # @return (status code, JSON serializable object)
+    async def dispatch(self, method, target, body):
+        if target == "/metrics":
+            if method != "GET":
+                return 405, {"error": "method not allowed"}
+            return 200, self.metrics.snapshot()
+        if target != "/solve":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "method not allowed"}
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {"error": "body isn't valid JSON"}
+        if isinstance(request, dict) and isinstance(request.get("expr"), str):
+            return 200, await self.solve(request["expr"])
+        if isinstance(request, dict) and isinstance(request.get("exprs"), list) \
+                and all(isinstance(expr, str) for expr in request["exprs"]):
+            results = await asyncio.gather(*[self.solve(expr) for expr in request["exprs"]])
+            return 200, list(results)
+        return 400, {"error": "expected {\"expr\": string} or {\"exprs\": [string, ...]}"}
+
+    ##
+    # @brief Serves one connection, requests are read until the client closes it
+    #
+    # @param reader asyncio.StreamReader of the connection
+    # @param writer asyncio.StreamWriter of the connection
+    async def handle(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > max_body:
+                    await self.respond(writer, 413 if length > max_body else 400, {"error": "wrong body length"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                self.metrics.requests += 1
+                status, payload = await self.dispatch(method, target.split("?", 1)[0], body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    ##
+    # @brief Writes HTTP response
+    #
+    # @param writer asyncio.StreamWriter of the connection
+    # @param status HTTP status code
+    # @param payload JSON serializable object
+    # @param keep_alive False if the connection is closed after the response
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, allow_nan=False).encode()
+        head = "HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n" % (
+            status, reasons[status], len(body), "keep-alive" if keep_alive else "close")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+##
+# @brief Runs the service until interrupted
+async def serve(args):
+    context = LibMath.Context(args.digits, Decimal if args.decimal else float)
+    server = CalcServer(args.workers, args.timeout, context)
+    address = await server.start(args.host, args.port, args.unix)
+    sys.stderr.write("listening on %s\n" % (address if args.unix else "http://%s:%d" % address,))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON service solving expressions.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="TCP port (default: 8080)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on Unix socket instead of TCP port")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--timeout", type=float, default=5.0, help="time limit of one expression in seconds")
+    parser.add_argument("--digits", type=int, help="number of digits results are rounded to")
+    parser.add_argument("--decimal", action="store_true", help="compute with decimal numbers instead of floats")
+    args = parser.parse_args(argv)
+
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# End of file server.py
@@ -0,0 +1,140 @@
+###################################################################
+# Project name: Gazorpazorp calculator
+# File: server_Tests.py
+# Authors: Vilem Gottwald
+# Description: Test for server.py
+###################################################################
+# Run the tests in directory src:
+# $ python3 server_Tests.py
+#
+
+import unittest
+import asyncio
+import json
+import LibMath
+import LibProcExpr
+import server
+
+
+# Tests of the service on localhost
+class TestCalcServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = server.CalcServer(workers=1, time_limit=1.0)
+        host, port = await self.server.start()
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.server.stop()
+
+    # sends request over the kept alive connection, returns status and decoded body
+    async def request(self, method, path, payload=None, writer=None, reader=None):
+        writer = writer or self.writer
+        reader = reader or self.reader
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(("%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n" % (method, path, len(body))).encode() + body)
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+
+    async def test_solve_and_keep_alive(self):
+        self.assertEqual(await self.request("POST", "/solve", {"expr": "2+3*4"}), (200, {"result": 14}))
+        status, body = await self.request("POST", "/solve", {"expr": "1/0"})
+        self.assertEqual(body["error"], "ZeroDivisionError")
+        status, body = await self.request("POST", "/solve", {"exprs": ["1+1", "5!3", "2^100"]})
+        self.assertEqual(body, [{"result": 2}, {"error": "ValueError", "message": "Error - expression in wrong format"},
+                                {"result": str(2**100)}])
+
+    async def test_concurrent_requests_are_batched(self):
+        connections = [await asyncio.open_connection(*self.server.server.sockets[0].getsockname()[:2]) for i in range(8)]
+        results = await asyncio.gather(*[self.request("POST", "/solve", {"expr": "%d*2" % i}, writer, reader)
+                                         for i, (reader, writer) in enumerate(connections)])
+        self.assertEqual([body["result"] for status, body in results], [i * 2 for i in range(8)])
+        for reader, writer in connections:
+            writer.close()
+        metrics = (await self.request("GET", "/metrics"))[1]
+        self.assertEqual(metrics["expressions"], 8)
+        self.assertLess(metrics["batches"], 8)
+        self.assertGreater(metrics["latency_ms"]["p99"], 0)
+
+    async def test_time_limit(self):
+        status, body = await self.request("POST", "/solve", {"expr": "99999999!"})
+        self.assertEqual(body["error"], "TimeoutError")
+        self.assertEqual(await self.request("POST", "/solve", {"expr": "1+1"}), (200, {"result": 2}))
+        self.assertEqual((await self.request("GET", "/metrics"))[1]["timeouts"], 1)
+
+    async def test_slow_expression_in_batch(self):
+        status, body = await self.request("POST", "/solve", {"exprs": ["99999999!", "1+1", "2*3"]})
+        self.assertEqual(body[0]["error"], "TimeoutError")
+        self.assertEqual(body[1:], [{"result": 2}, {"result": 6}])
+
+    async def test_connection_close(self):
+        reader, writer = await asyncio.open_connection(*self.server.server.sockets[0].getsockname()[:2])
+        body = json.dumps({"expr": "1+1"}).encode()
+        writer.write(b"POST /solve HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        # the response ends by closing the connection
+        response = await asyncio.wait_for(reader.read(), 5)
+        self.assertTrue(response.endswith(b'{"result": 2}'))
+        writer.close()
+
+    async def test_time_limit_of_huge_result(self):
+        # the result is computed quickly, but converting it to a string takes much longer than the limit
+        start = asyncio.get_running_loop().time()
+        status, body = await self.request("POST", "/solve", {"expr": "9^1000000"})
+        self.assertEqual(body["error"], "TimeoutError")
+        self.assertLess(asyncio.get_running_loop().time() - start, 3)
+        self.assertLess((await self.request("GET", "/metrics"))[1]["latency_ms"]["max"], 3000)
+
+    async def test_pool_broken_while_idle(self):
+        self.assertEqual(await self.request("POST", "/solve", {"expr": "1+1"}), (200, {"result": 2}))
+        pool = self.server.pool
+        for process in list(pool._processes.values()):
+            process.kill()
+        for i in range(500):
+            if pool._broken:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(pool._broken)
+        self.assertEqual(await asyncio.wait_for(self.request("POST", "/solve", {"expr": "2*3"}), 10), (200, {"result": 6}))
+        self.assertIsNot(self.server.pool, pool)
+
+    async def test_pool_broken_while_solving(self):
+        self.assertEqual(await self.request("POST", "/solve", {"expr": "1+1"}), (200, {"result": 2}))
+        pool = self.server.pool
+        pending = asyncio.ensure_future(self.request("POST", "/solve", {"expr": "99999999!"}))
+        await asyncio.sleep(0.2)
+        for process in list(pool._processes.values()):
+            process.kill()
+        status, body = await asyncio.wait_for(pending, 10)
+        self.assertEqual(body["error"], "BrokenProcessPool")
+        self.assertIsNot(self.server.pool, pool)
+        self.assertTrue(pool._shutdown_thread)
+        self.assertEqual(await self.request("POST", "/solve", {"expr": "2*3"}), (200, {"result": 6}))
+
+    async def test_bad_requests(self):
+        self.assertEqual((await self.request("POST", "/solve", {"x": 1}))[0], 400)
+        self.assertEqual((await self.request("GET", "/solve"))[0], 405)
+        self.assertEqual((await self.request("GET", "/nothing"))[0], 404)
+
+
+# Tests of the work done in worker processes
+class TestSolveBatch(unittest.TestCase):
+
+    def test_batch_is_not_cached(self):
+        LibProcExpr.expr_cache.clear()
+        exprs = ["+".join(["1"] * 1000 + [str(i)]) for i in range(50)]
+        results = server.solve_batch(exprs, 10.0, LibMath.Context())
+        self.assertEqual(results[3], {"result": 1003})
+        self.assertEqual(LibProcExpr.expr_cache.stats()["size"], 0)
+
+# to simplify testing
+if __name__ == '__main__':
+    unittest.main()